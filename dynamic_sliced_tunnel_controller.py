@@ -26,6 +26,7 @@ class ModularSliceController(app_manager.RyuApp):
         print("[+] ModularSliceController initialized")
         self.datapaths = {}
         self.last_flows = []
+        self.pending_arp = []   # (host, ip, mac) entries pushed in one batch per poll
         threading.Thread(target=self.flow_monitor_loop, daemon=True).start()
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
@@ -58,6 +59,7 @@ class ModularSliceController(app_manager.RyuApp):
 
             for flow in added:
                 self.install_flow_on_all(flow)
+            self.push_static_arps()
 
             self.last_flows = flows
             time.sleep(2)
@@ -109,8 +111,8 @@ class ModularSliceController(app_manager.RyuApp):
 
             src_host = self.ip_to_host(s["src_ip"])
             dst_host = self.ip_to_host(s["dst_ip"])
-            self.push_static_arp(src_host, s["dst_ip"], s["dst_mac"])
-            self.push_static_arp(dst_host, s["src_ip"], s["src_mac"])
+            self.pending_arp.append((src_host, s["dst_ip"], s["dst_mac"]))
+            self.pending_arp.append((dst_host, s["src_ip"], s["src_mac"]))
 
     def remove_slice(self, datapath, sw_name, s):
         parser = datapath.ofproto_parser
@@ -179,6 +181,30 @@ class ModularSliceController(app_manager.RyuApp):
         except Exception as e:
             print(f"[!] Error in ARP push: {e}")
 
+    def push_static_arps(self):
+        # All pending ARP entries in one /exec_batch round trip, duplicates dropped
+        entries = list(dict.fromkeys(self.pending_arp))
+        self.pending_arp = []
+        if not entries:
+            return
+        url = "http://127.0.0.1:5000/exec_batch"
+        commands = [{"id": f"{host} {ip}", "host": host, "cmd": f"arp -s {ip} {mac}"} for host, ip, mac in entries]
+        try:
+            response = requests.post(url, json={"commands": commands}, timeout=10)
+            if response.status_code == 404:
+                # Older runner without /exec_batch: one /exec per entry
+                for entry in entries:
+                    self.push_static_arp(*entry)
+            elif response.ok:
+                failed = [cid for cid, r in response.json()["results"].items() if "error" in r]
+                print(f"[✓] ARP pushed: {len(entries) - len(failed)}/{len(entries)} entries")
+                for cid in failed:
+                    print(f"[!] ARP push failed: {cid}")
+            else:
+                print(f"[!] ARP batch push failed: status={response.status_code}")
+        except Exception as e:
+            print(f"[!] Error in ARP batch push: {e}")
+
     def set_link_bw(self, node1, node2, bw):
         url = "http://127.0.0.1:5000/set_bw"
         payload = {"node1": node1, "node2": node2, "bw": bw}
@@ -1,16 +1,90 @@
 import os
 import csv
+import json
+import argparse
+import contextlib
+import threading
 import networkx as nx
+try:
+    import numpy as np
+except ImportError:  # path scoring falls back to the pure-Python loop
+    np = None
 import requests
 import subprocess
 import signal
 import sys
+import time
+import heapq
+import math
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from collections import OrderedDict, defaultdict
+from topology_store import load_links, snapshot_path, write_snapshot
 # ─────────────────────────────
 # Constants
 # ─────────────────────────────
 RUNNING_PATH = 'data/running_network.csv'
+INITIAL_PATH = 'data/initial_topology.csv'
 ALLOCATED_FLOW_CSV = 'data/allocated_flow.csv'
+JOURNAL_PATH = 'data/allocation_journal.jsonl'
+SNAPSHOT_PATH = 'data/allocation_snapshot.json'
+SNAPSHOT_EVERY = 500    # journal events between compacted snapshots
+FLOW_API_URL = 'http://localhost:5000'
+
+# Allocator service (main.py --serve)
+SERVICE_SOCKET = 'data/allocator.sock'
+SERVICE_WORKERS = 8     # concurrent requests in path search / flow API calls
+RESERVE_RETRIES = 3     # re-selections when a concurrent commit took the chosen path's bandwidth
 BASE_TCP_PORT = 5001
+MAX_TUNNEL_ID = 65535 - BASE_TCP_PORT   # highest tunnel ID whose TCP port still fits in 16 bits
+FLUSH_DELAY = 0.5       # seconds to coalesce residual-graph writes before flushing to disk
+
+# Per-request search budget for candidate path enumeration
+PATH_BUDGET = 64        # max candidate paths examined
+TIME_BUDGET = 2.0       # max seconds spent enumerating
+
+# Path search policies. Enumerating ones run K-shortest then least segmentation:
+# plain ('ksp') or constrained with links pruned by bandwidth first ('cspf').
+# The single-pass routing policies (widest, min-hop, load-balanced) are defined below.
+ENUMERATION_POLICIES = ('ksp', 'cspf')
+DEFAULT_POLICY = 'cspf'
+DEFAULT_K = 5
+
+# Widest-path admission index: full rebuild after this many bandwidth decreases to tighten bounds
+BOTTLENECK_REBUILD_EVERY = 128
+
+# Candidate path cache
+PATH_CACHE_SIZE = 1024      # (src, dst, k, policy, bw floor) entries kept, LRU evicted
+PATH_CACHE_MAX_AGE = 256    # capacity updates after which an entry is recomputed rather than revalidated
+
+# Re-optimization (defragmentation) of admitted slices
+DEFRAG_MAX_MOVES = 10       # tunnels migrated per round at most
+DEFRAG_K = 8                # fewest-hop candidates considered per tunnel in the re-placement
+FLOWMODS_PER_SWITCH = 4     # forward + reverse flow record, each installing two matches per switch
+
+# Split allocation: a demand no single path can carry is spread over several subflows
+MAX_SUBFLOWS = 4            # paths one demand may be divided across
+MIN_SUBFLOW_BW = 1          # smallest share (Mbps) worth a separate subflow
+
+# Priority classes: higher wins, and a request that does not fit may preempt lower-priority tunnels
+DEFAULT_PRIORITY = 0
+MAX_PRIORITY = 7
+PREEMPT_INDEX_SLACK = 256   # stale per-link index entries tolerated before a rebuild
+
+# Slice leases: allocations may carry a TTL and are released when it runs out unless renewed
+LEASE_TICK = 1.0            # seconds per slot of the finest timer wheel
+WHEEL_SLOTS = 64            # slots per wheel level
+WHEEL_LEVELS = 4            # 64**4 ticks, about 194 days of lease range at 1 s
+EXPIRY_BATCH = 64           # expired tunnels torn down per bulk API call
+
+# Advance reservations: bandwidth booked per link over time for future windows
+CALENDAR_SLOT = 60          # seconds per calendar slot (windows are rounded outwards)
+CALENDAR_HORIZON = 7 * 24 * 3600    # how far ahead bookings may end
+
+# Delay-bounded routing: per-link delay (ms) from the topology CSV, bounds per request
+LARAC_MAX_ITER = 20         # Lagrangian multiplier updates before the label search takes over
+DELAY_LABEL_BUDGET = 20000  # (cost, delay) labels the exact search may create
 
 # ─────────────────────────────
 # Utility Functions
@@ -21,206 +95,2824 @@ def hard_kill(pid):
     except Exception as e:
         print(f"Failed to kill terminal PID {pid}: {e}")
 
-def load_graph_from_csv(path):
-    G = nx.Graph()
-    with open(path) as f:
-        for row in csv.reader(f):
-            if len(row) == 3:
-                a, b, bw = row
-                G.add_edge(a, b, weight=int(bw))
+def load_graph(path):
+    """
+    Directed residual graph: every link becomes two arcs with their own capacity and
+    the link's delay. Read from the binary snapshot next to the CSV at path while it is
+    current, otherwise from the CSV (rows a,b,bw for a symmetric link or a,b,bw_ab,bw_ba
+    for an asymmetric one, optionally followed by a delay such as 5ms).
+    """
+    G = nx.DiGraph()
+    for a, b, bw, bw_rev, delay in load_links(path):
+        G.add_edge(a, b, weight=bw, delay=delay)
+        G.add_edge(b, a, weight=bw_rev, delay=delay)
     return G
 
+def graph_links(G):
+    """(a, b, bw_ab, bw_ba, delay_ms) once per link of the directed graph."""
+    seen = set()
+    for u, v, data in G.edges(data=True):
+        if (v, u) in seen:
+            continue
+        seen.add((u, v))
+        yield u, v, data['weight'], G[v][u]['weight'], data.get('delay', 0.0)
+
 def save_graph_to_csv(G, path):
-    with open(path, 'w', newline='') as f:
+    # Write to a temp file and rename, so the live visualizer never reads a half-written CSV
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', newline='') as f:
         writer = csv.writer(f)
-        for u, v, data in G.edges(data=True):
-            writer.writerow([u, v, data['weight']])
+        for u, v, w, w_rev, delay in graph_links(G):
+            row = [u, v, w] if w == w_rev else [u, v, w, w_rev]
+            if delay:
+                row.append(f"{delay:g}ms")
+            writer.writerow(row)
+    os.replace(tmp_path, path)
 
-def least_segmentation(G, paths, alloc_bw):
+def save_graph(G, path):
+    """CSV export plus its binary snapshot, written second so it is never older than the CSV."""
+    save_graph_to_csv(G, path)
+    write_snapshot(snapshot_path(path), graph_links(G))
+
+def k_shortest_paths(G, src, dst, k, weight='weight', path_budget=PATH_BUDGET, time_budget=TIME_BUDGET):
+    """
+    Lazily pulls simple paths from Yen's generator in cost order and stops at
+    the first K, or earlier when the path or time budget is spent.
+    Returns (paths, stats) where stats reports how many candidates were examined.
+    """
+    limit = min(k, path_budget)
+    stats = {"examined": 0, "elapsed_ms": 0.0, "stop": "k"}
+    paths = []
+    start = time.perf_counter()
+    try:
+        for path in islice(nx.shortest_simple_paths(G, src, dst, weight=weight), limit):
+            paths.append(path)
+            stats["examined"] += 1
+            if len(paths) < limit and time.perf_counter() - start >= time_budget:
+                stats["stop"] = "time_budget"
+                break
+        else:
+            if len(paths) < k:
+                stats["stop"] = "path_budget" if len(paths) == limit else "exhausted"
+    except nx.NetworkXNoPath:
+        stats["stop"] = "exhausted"
+    stats["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return paths, stats
+
+def feasible_subgraph(G, bw, bw_rev=None):
+    """
+    Copy of G keeping only arcs that can carry bw while their reverse arc keeps bw_rev
+    (default bw) for the return direction (one pass over the arcs).
+    """
+    bw_rev = bw if bw_rev is None else bw_rev
+    H = nx.DiGraph()
+    H.add_nodes_from(G)
+    H.add_edges_from((u, v, d) for u, v, d in G.edges(data=True)
+                     if d['weight'] >= bw and G[v][u]['weight'] >= bw_rev)
+    return H
+
+def find_candidate_paths(G, src, dst, k, bw, policy=DEFAULT_POLICY, bw_rev=None):
+    """
+    Candidate paths for a request under the given search policy.
+    'ksp' enumerates over the full graph; 'cspf' first drops every link below bw,
+    so an infeasible request fails with a single connectivity check.
+    """
+    if policy == 'ksp':
+        return k_shortest_paths(G, src, dst, k)
+    if policy != 'cspf':
+        raise ValueError(f"Unknown path policy '{policy}'.")
+
+    start = time.perf_counter()
+    H = feasible_subgraph(G, bw, bw_rev)
+    pruned = G.number_of_edges() - H.number_of_edges()
+    if not nx.has_path(H, src, dst):
+        stats = {"examined": 0, "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+                 "stop": "infeasible", "pruned_links": pruned}
+        return [], stats
+    paths, stats = k_shortest_paths(H, src, dst, k)
+    stats["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    stats["pruned_links"] = pruned
+    return paths, stats
+
+def path_headroom(G, path, bw, bw_rev=None, held=None):
+    """
+    Smallest residual left on path once bw goes forward and bw_rev (default bw) back,
+    not counting held bandwidth ({arc: Mbps}) as residual.
+    """
+    bw_rev = bw if bw_rev is None else bw_rev
+    held = held or {}
+    links = list(zip(path[:-1], path[1:]))
+    return min(min(G[u][v]['weight'] - held.get((u, v), 0) - bw for u, v in links),
+               min(G[v][u]['weight'] - held.get((v, u), 0) - bw_rev for u, v in links))
+
+def least_segmentation(G, paths, alloc_bw, rev_bw=None, held=None):
     best_path, best_seg = None, float('inf')
     for path in paths:
-        segments = [G[u][v]['weight'] - alloc_bw for u, v in zip(path[:-1], path[1:])]
-        if any(s < 0 for s in segments):
+        min_seg = path_headroom(G, path, alloc_bw, rev_bw, held)
+        if min_seg < 0:
             continue
-        min_seg = min(segments)
         if min_seg < best_seg:
             best_path, best_seg = path, min_seg
     if not best_path:
         raise ValueError("No valid path found with enough bandwidth.")
     return best_path, best_seg
 
-def assign_tunnel_id():
-    if not os.path.exists(ALLOCATED_FLOW_CSV) or os.path.getsize(ALLOCATED_FLOW_CSV) == 0:
-        return 1
-    with open(ALLOCATED_FLOW_CSV) as f:
-        last = list(csv.reader(f))[-1]
-        return int(last[-2]) + 1
+class EdgeIndex:
+    """
+    Column index for every arc of G plus a NumPy residual vector kept in sync with it.
+    A set of candidate paths becomes a (paths x hops) matrix of column indices, padded
+    with an extra column whose residual is +inf, i.e. a sparse path-by-edge incidence;
+    the rows of the reversed paths index the arcs used by the return direction.
+    """
 
-def update_graph_bandwidth(G, path, bw_delta):
-    for u, v in zip(path[:-1], path[1:]):
-        G[u][v]['weight'] -= bw_delta
-        if G[u][v]['weight'] < 0:
-            raise ValueError(f"Link {u}-{v} has negative bandwidth.")
-    save_graph_to_csv(G, RUNNING_PATH)
+    PAD = np.inf if np else None
 
-def save_flow(path, bw, tunnel_id, tcp_port):
-    with open(ALLOCATED_FLOW_CSV, 'a', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(path + [bw, tunnel_id, tcp_port])
-
-def remove_flow_by_tunnel_id(tunnel_id):
-    with open(ALLOCATED_FLOW_CSV) as f:
-        lines = list(csv.reader(f))
-    remaining = []
-    removed = []
-    for row in lines:
-        if int(row[-2]) == tunnel_id:
-            removed.append(row)
+    def __init__(self, G):
+        self.col = {}
+        weights = []
+        for i, (u, v, w) in enumerate(G.edges(data='weight')):
+            self.col[(u, v)] = i
+            weights.append(w)
+        self.pad = len(weights)
+        # float64: capacities may be fractional (e.g. a 10.5 Mbps link)
+        self.residual = np.array(weights + [self.PAD], dtype=np.float64)
+
+    def path_rows(self, paths):
+        hops = max(len(p) for p in paths) - 1
+        rows = np.full((len(paths), hops), self.pad, dtype=np.intp)
+        for i, p in enumerate(paths):
+            rows[i, :len(p) - 1] = [self.col[e] for e in zip(p[:-1], p[1:])]
+        return rows
+
+    def update(self, path, bw_delta, rev_delta=None):
+        rev_delta = bw_delta if rev_delta is None else rev_delta
+        for u, v in zip(path[:-1], path[1:]):
+            self.residual[self.col[(u, v)]] -= bw_delta
+            self.residual[self.col[(v, u)]] -= rev_delta
+
+    def without(self, held):
+        """The residual vector, or a copy of it with held bandwidth ({arc: Mbps}) taken out."""
+        if not held:
+            return self.residual
+        residual = self.residual.copy()
+        for arc, amount in held.items():
+            residual[self.col[arc]] -= amount
+        return residual
+
+def least_segmentation_vectorized(index, paths, rows, alloc_bw, rev_rows, rev_bw, held=None):
+    """Same choice as least_segmentation, scoring all candidates in two gathers + row-mins."""
+    residual = index.without(held)
+    segs = np.minimum(residual[rows].min(axis=1) - alloc_bw,
+                      residual[rev_rows].min(axis=1) - rev_bw)
+    segs = np.where(segs >= 0, segs, EdgeIndex.PAD)
+    best = int(segs.argmin())
+    if segs[best] == EdgeIndex.PAD:
+        raise ValueError("No valid path found with enough bandwidth.")
+    seg = float(segs[best])
+    return paths[best], int(seg) if seg.is_integer() else seg
+
+class TunnelIdAllocator:
+    """
+    Constant-time tunnel ID / TCP port allocator. A bitmap marks IDs in use and a
+    free list holds released IDs, which are handed out again before fresh ones.
+    Built once at startup from the IDs already present in the flow store.
+    """
+
+    def __init__(self, used_ids=(), max_id=MAX_TUNNEL_ID):
+        self.max_id = max_id
+        self._in_use = bytearray(max_id + 1)
+        for tid in used_ids:
+            if not 1 <= tid <= max_id:
+                raise ValueError(f"Tunnel ID {tid} out of range 1..{max_id}.")
+            self._in_use[tid] = 1
+        self._next = max((tid for tid in range(1, max_id + 1) if self._in_use[tid]), default=0) + 1
+        # Holes below the high-water mark; reversed so the lowest ID is reused first
+        self._free = [tid for tid in range(self._next - 1, 0, -1) if not self._in_use[tid]]
+
+    @staticmethod
+    def port_for(tunnel_id):
+        return BASE_TCP_PORT + tunnel_id
+
+    def allocate(self):
+        """Returns (tunnel_id, tcp_port)."""
+        if self._free:
+            tid = self._free.pop()
+        elif self._next <= self.max_id:
+            tid = self._next
+            self._next += 1
         else:
-            remaining.append(row)
-    with open(ALLOCATED_FLOW_CSV, 'w', newline='') as f:
+            raise ValueError("Tunnel ID / TCP port space exhausted.")
+        self._in_use[tid] = 1
+        return tid, self.port_for(tid)
+
+    def release(self, tunnel_id):
+        if not 1 <= tunnel_id <= self.max_id or not self._in_use[tunnel_id]:
+            return False
+        self._in_use[tunnel_id] = 0
+        self._free.append(tunnel_id)
+        return True
+
+    def in_use(self, tunnel_id):
+        return 1 <= tunnel_id <= self.max_id and bool(self._in_use[tunnel_id])
+
+def update_graph_bandwidth(G, path, bw_delta, rev_delta=None):
+    """Takes bw_delta from the arcs along path and rev_delta (default bw_delta) from the reverse arcs."""
+    rev_delta = bw_delta if rev_delta is None else rev_delta
+    links = list(zip(path[:-1], path[1:]))
+    arcs = [(u, v, bw_delta) for u, v in links] + [(v, u, rev_delta) for u, v in links]
+    # Validate every arc first so a rejected update leaves the graph untouched
+    for u, v, delta in arcs:
+        if G[u][v]['weight'] - delta < 0:
+            raise ValueError(f"Link {u}->{v} has negative bandwidth.")
+    for u, v, delta in arcs:
+        G[u][v]['weight'] -= delta
+
+def reverse_bw(flow):
+    """Return-direction bandwidth of a flow or booking (stored only when it differs from bw)."""
+    return flow.get("bw_rev", flow["bw"])
+
+def load_flows_from_csv(path=ALLOCATED_FLOW_CSV):
+    flows = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for row in csv.reader(f):
+                if row:
+                    flows.setdefault(int(row[-2]), {"path": row[:-3], "bw": int(row[-3]), "tcp_port": int(row[-1])})
+    return flows
+
+def lease_end(lease):
+    """Absolute end of a lease given in seconds from now; None (no lease) stays None."""
+    return time.time() + lease if lease else None
+
+def format_time(t):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
+
+def save_flows_to_csv(flows, path=ALLOCATED_FLOW_CSV):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', newline='') as f:
         writer = csv.writer(f)
-        writer.writerows(remaining)
-    return removed
-
-def call_flow_api(command, path, tcp_port, rate, bidirectional=True):
-    url = "http://localhost:5000/flow"
-    payload = {
-        "command": command,
-        "path": path,
-        "tcp_port": tcp_port,
-        "rate": rate,
-        "bidirectional": bidirectional
-    }
-    try:
-        response = requests.post(url, json=payload, timeout=5)
-        if response.ok:
-            print(f"\U0001f310 Flow API success ({command}): TCP {tcp_port}")
-            return True
+        for tid, flow in flows.items():
+            writer.writerow(flow["path"] + [flow["bw"], tid, flow["tcp_port"]])
+    os.replace(tmp_path, path)
+
+# ─────────────────────────────
+# Routing Policies
+# ─────────────────────────────
+
+class RoutingPolicy:
+    """
+    A routing policy picks one path for (src, dst, bw) with a single modified Dijkstra
+    run, O(E log V), instead of enumerating candidates. Subclasses define the label
+    kept per node through start(), extend() and better(). Arcs whose reverse arc cannot
+    carry bw_rev for the return direction are skipped.
+    """
+    name = None
+
+    def start(self):
+        raise NotImplementedError
+
+    def extend(self, label, residual, bw):
+        """Label after crossing a link with this residual, or None if the link is unusable."""
+        raise NotImplementedError
+
+    def better(self, a, b):
+        return a < b
+
+    def find_path(self, G, src, dst, bw, bw_rev=None):
+        bw_rev = bw if bw_rev is None else bw_rev
+        start = time.perf_counter()
+        best = {src: self.start()}
+        prev = {src: None}
+        done = set()
+        counter = 0
+        heap = [(self._key(best[src]), counter, src)]
+        while heap:
+            _, _, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            if u == dst:
+                break
+            for v, data in G[u].items():
+                if v in done or G[v][u]['weight'] < bw_rev:
+                    continue
+                label = self.extend(best[u], data['weight'], bw)
+                if label is None:
+                    continue
+                if v not in best or self.better(label, best[v]):
+                    best[v], prev[v] = label, u
+                    counter += 1
+                    heapq.heappush(heap, (self._key(label), counter, v))
+
+        stats = {"examined": len(done), "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+                 "stop": "policy", "policy": self.name}
+        if dst not in done:
+            stats["stop"] = "infeasible"
+            return None, stats
+        path, node = [], dst
+        while node is not None:
+            path.append(node)
+            node = prev[node]
+        return path[::-1], stats
+
+    def _key(self, label):
+        return label
+
+class WidestPathPolicy(RoutingPolicy):
+    """Maximises the bottleneck residual, ties broken by fewer hops."""
+    name = 'widest'
+
+    def start(self):
+        return (float('inf'), 0)
+
+    def extend(self, label, residual, bw):
+        if residual < bw:
+            return None
+        return (min(label[0], residual), label[1] + 1)
+
+    def better(self, a, b):
+        return (-a[0], a[1]) < (-b[0], b[1])
+
+    def _key(self, label):
+        return (-label[0], label[1])
+
+class MinHopPolicy(RoutingPolicy):
+    """Fewest hops using only links that can carry the request (bandwidth floor)."""
+    name = 'min-hop'
+
+    def start(self):
+        return 0
+
+    def extend(self, label, residual, bw):
+        return label + 1 if residual >= bw else None
+
+class LoadBalancedPolicy(RoutingPolicy):
+    """Cheapest path with link cost 1/residual, steering flows away from congested links."""
+    name = 'load-balanced'
+
+    def start(self):
+        return 0.0
+
+    def extend(self, label, residual, bw):
+        if residual < bw or residual <= 0:
+            return None
+        return label + 1.0 / residual
+
+ROUTING_POLICIES = {p.name: p for p in (WidestPathPolicy(), MinHopPolicy(), LoadBalancedPolicy())}
+PATH_POLICIES = ENUMERATION_POLICIES + tuple(ROUTING_POLICIES)
+
+def split_demand(G, src, dst, bw, max_subflows=MAX_SUBFLOWS):
+    """
+    Divides a symmetric bw over up to max_subflows paths by successive widest paths on a
+    copy of the residuals: each path carries min(its bottleneck in either direction, what
+    is left of the demand). Returns [(path, share), ...], or None if the demand does not fit.
+    """
+    W = G.copy()
+    widest = ROUTING_POLICIES['widest']
+    parts, remaining = [], bw
+    while remaining > 0 and len(parts) < max_subflows:
+        path, _ = widest.find_path(W, src, dst, MIN_SUBFLOW_BW)
+        if path is None:
+            break
+        share = min(remaining, path_headroom(W, path, 0))
+        update_graph_bandwidth(W, path, share)
+        parts.append((path, share))
+        remaining -= share
+    return parts if remaining <= 0 else None
+
+# ─────────────────────────────
+# Delay-Constrained Routing
+# ─────────────────────────────
+
+def path_delay(G, path):
+    """End-to-end delay (ms) of path."""
+    return sum(G[u][v].get('delay', 0) for u, v in zip(path[:-1], path[1:]))
+
+def _arc_cost(u, v, data):
+    # Same link cost as the load-balanced policy: steer away from congested links
+    return 1.0 / data['weight']
+
+def _arc_delay(u, v, data):
+    return data.get('delay', 0)
+
+def path_cost(G, path):
+    return sum(_arc_cost(u, v, G[u][v]) for u, v in zip(path[:-1], path[1:]))
+
+def delay_constrained_path(G, src, dst, bw, max_delay, bw_rev=None, label_budget=DELAY_LABEL_BUDGET):
+    """
+    Cheapest path (link cost 1/residual) with at most max_delay ms end to end, over the
+    arcs that can carry bw (and bw_rev back). LARAC first: Dijkstra on cost + lambda*delay,
+    with lambda moved by Lagrangian relaxation, yields a feasible path and a lower bound
+    within a few runs. If a gap remains, a label-setting search over (cost, delay) labels
+    closes it: dominated labels are dropped, and a label is pruned once its cost reaches
+    the LARAC path's or its delay plus the least delay left to dst exceeds max_delay.
+    Past label_budget labels the LARAC path stands. Returns (path, stats), path None if
+    no path meets the bound.
+    """
+    start = time.perf_counter()
+    stats = {"examined": 0, "elapsed_ms": 0.0, "stop": "infeasible", "policy": "delay", "larac_iterations": 0}
+
+    def done(path):
+        stats["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        if path is not None:
+            stats["delay_ms"] = round(path_delay(H, path), 3)
+        return path, stats
+
+    H = feasible_subgraph(G, max(bw, 1), bw_rev)  # an arc needs some residual for a finite cost
+    # Least delay from every node to dst: the admissible bound used for pruning
+    to_dst = nx.single_source_dijkstra_path_length(H.reverse(copy=False), dst, weight=_arc_delay)
+    if to_dst.get(src, float('inf')) > max_delay:
+        return done(None)
+
+    # ── LARAC ──
+    p_c = nx.dijkstra_path(H, src, dst, weight=_arc_cost)
+    if path_delay(H, p_c) <= max_delay:
+        stats["stop"] = "cheapest"
+        return done(p_c)
+    p_d = nx.dijkstra_path(H, src, dst, weight=_arc_delay)
+    lower = 0.0
+    for _ in range(LARAC_MAX_ITER):
+        c_c, d_c = path_cost(H, p_c), path_delay(H, p_c)
+        c_d, d_d = path_cost(H, p_d), path_delay(H, p_d)
+        lam = (c_c - c_d) / (d_d - d_c)
+        r = nx.dijkstra_path(H, src, dst, weight=lambda u, v, d: _arc_cost(u, v, d) + lam * _arc_delay(u, v, d))
+        stats["larac_iterations"] += 1
+        c_r, d_r = path_cost(H, r), path_delay(H, r)
+        lower = max(lower, c_r + lam * (d_r - max_delay))
+        if c_r + lam * d_r >= c_c + lam * d_c - 1e-12:
+            break
+        if d_r <= max_delay:
+            p_d = r
         else:
-            print(f"\u26a0\ufe0f Flow API failed ({command}): HTTP {response.status_code} - {response.text}")
-            return False
-    except Exception as e:
-        print(f"\u274c Error calling flow API ({command}): {e}")
+            p_c = r
+    best_cost = path_cost(H, p_d)
+    if best_cost - lower <= 1e-9 * max(1.0, best_cost):
+        stats["stop"] = "larac"
+        return done(p_d)
+
+    # ── label setting with pruning ──
+    labels = [(src, None)]   # (node, parent label) for path reconstruction
+    front = {src: [(0.0, 0.0, 0)]}   # non-dominated (cost, delay, label) per node
+    dead = set()
+    heap = [(0.0, 0.0, 0)]
+    stats["stop"] = "larac"
+    while heap:
+        cost, delay, i = heapq.heappop(heap)
+        if i in dead:
+            continue
+        node = labels[i][0]
+        stats["examined"] += 1
+        if node == dst:
+            path = []
+            while i is not None:
+                path.append(labels[i][0])
+                i = labels[i][1]
+            stats["stop"] = "labels"
+            return done(path[::-1])
+        for v, data in H[node].items():
+            c, d = cost + _arc_cost(node, v, data), delay + data.get('delay', 0)
+            if c >= best_cost or d + to_dst.get(v, float('inf')) > max_delay:
+                continue
+            kept = front.setdefault(v, [])
+            if any(kc <= c and kd <= d for kc, kd, _ in kept):
+                continue
+            dead.update(j for kc, kd, j in kept if c <= kc and d <= kd)
+            kept[:] = [entry for entry in kept if not (c <= entry[0] and d <= entry[1])]
+            if len(labels) >= label_budget:
+                stats["stop"] = "label_budget"
+                return done(p_d)
+            labels.append((v, i))
+            kept.append((c, d, len(labels) - 1))
+            heapq.heappush(heap, (c, d, len(labels) - 1))
+    return done(p_d)
+
+# ─────────────────────────────
+# Bottleneck (Widest-Path) Index
+# ─────────────────────────────
+
+class BottleneckIndex:
+    """
+    Answers "is there any path from src to dst with >= B Mbps left?" in O(log V).
+    On a maximum spanning forest of the residual graph, the smallest link on the tree
+    path between two nodes is exactly the widest-path bottleneck between them; binary
+    lifting over the forest finds that minimum in O(log V).
+
+    The index keeps its weights >= the true residuals, so it is always a safe upper
+    bound for rejecting requests: bandwidth decreases are only counted (a full rebuild
+    after BOTTLENECK_REBUILD_EVERY of them tightens the bound again), while increases
+    that could widen a path mark the index for rebuild before the next query.
+    On the directed residual graph a link weighs the larger of its two arcs, so the
+    bound holds in both directions when queried with the larger of bw and bw_rev.
+    """
+
+    def __init__(self, G, rebuild_every=BOTTLENECK_REBUILD_EVERY):
+        self.G = G
+        self.rebuild_every = rebuild_every
+        self.rebuilds = 0
+        self.rejections = 0
+        self.rebuild()
+
+    def _weight(self, u, v):
+        return max(self.G[u][v]['weight'], self.G[v][u]['weight'])
+
+    def rebuild(self):
+        U = nx.Graph()
+        U.add_nodes_from(self.G)
+        U.add_weighted_edges_from((u, v, self._weight(u, v)) for u, v in self.G.edges())
+        T = nx.maximum_spanning_tree(U, weight='weight')
+        nodes = list(self.G.nodes())
+        self.idx = {n: i for i, n in enumerate(nodes)}
+        n = len(nodes)
+        self.levels = max(1, n.bit_length())
+        parent = [-1] * n
+        up_w = [float('inf')] * n
+        self.depth = [0] * n
+        self.comp = [-1] * n
+        self.tree_w = {}
+
+        for root in nodes:
+            r = self.idx[root]
+            if self.comp[r] != -1:
+                continue
+            self.comp[r] = r
+            stack = [root]
+            while stack:
+                a = stack.pop()
+                ia = self.idx[a]
+                for b, data in T[a].items():
+                    ib = self.idx[b]
+                    if self.comp[ib] != -1:
+                        continue
+                    self.comp[ib] = r
+                    parent[ib] = ia
+                    up_w[ib] = data['weight']
+                    self.depth[ib] = self.depth[ia] + 1
+                    self.tree_w[frozenset((a, b))] = data['weight']
+                    stack.append(b)
+
+        # up[j][v]: 2^j-th ancestor of v; mn[j][v]: smallest link weight on that climb
+        self.up = [[p if p != -1 else i for i, p in enumerate(parent)]]
+        self.mn = [up_w]
+        for j in range(1, self.levels):
+            prev_up, prev_mn = self.up[-1], self.mn[-1]
+            self.up.append([prev_up[prev_up[v]] for v in range(n)])
+            self.mn.append([min(prev_mn[v], prev_mn[prev_up[v]]) for v in range(n)])
+
+        self.dirty = False
+        self.decreases = 0
+        self.rebuilds += 1
+
+    def _tree_min(self, a, b):
+        if self.comp[a] != self.comp[b]:
+            return 0
+        best = float('inf')
+        if self.depth[a] < self.depth[b]:
+            a, b = b, a
+        diff = self.depth[a] - self.depth[b]
+        j = 0
+        while diff:
+            if diff & 1:
+                best = min(best, self.mn[j][a])
+                a = self.up[j][a]
+            diff >>= 1
+            j += 1
+        if a == b:
+            return best
+        for j in range(self.levels - 1, -1, -1):
+            if self.up[j][a] != self.up[j][b]:
+                best = min(best, self.mn[j][a], self.mn[j][b])
+                a, b = self.up[j][a], self.up[j][b]
+        return min(best, self.mn[0][a], self.mn[0][b])
+
+    def bottleneck(self, src, dst):
+        """Upper bound on the widest-path bandwidth between src and dst."""
+        if self.dirty or self.decreases >= self.rebuild_every:
+            self.rebuild()
+        return self._tree_min(self.idx[src], self.idx[dst])
+
+    def can_admit(self, src, dst, bw):
+        if self.bottleneck(src, dst) >= bw:
+            return True
+        self.rejections += 1
         return False
 
+    def update(self, path, bw_delta):
+        """Call after update_graph_bandwidth has applied bw_delta to the links of path."""
+        if self.dirty:
+            return
+        for u, v in zip(path[:-1], path[1:]):
+            if bw_delta > 0:
+                self.decreases += 1
+                continue
+            w = self._weight(u, v)
+            stored = self.tree_w.get(frozenset((u, v)))
+            if stored is not None:
+                # A tree link only needs new tables if it grew beyond its (upper-bound) weight
+                if w > stored:
+                    self.dirty = True
+                    return
+            elif w > self._tree_min(self.idx[u], self.idx[v]):
+                # Cycle property broken: this link now belongs in the maximum spanning tree
+                self.dirty = True
+                return
+
 # ─────────────────────────────
-# Main Loop
+# Preemption Index
+# ─────────────────────────────
+
+def link_key(u, v):
+    return (u, v) if u <= v else (v, u)
+
+class PreemptionIndex:
+    """
+    Per-link min-heaps of the tunnels crossing each link, ordered by (priority, bw), so
+    preemption only ever looks at the least important tunnels of the links it needs.
+    Stale heap entries are not removed eagerly: an entry is trusted only while the flow
+    table still has that tunnel on that link with the same priority and bandwidth.
+    add()/discard() keep a running count of the live (tunnel, link) pairs, and the
+    heaps are rebuilt once stale entries outnumber them.
+    """
+
+    def __init__(self, flows, slack=PREEMPT_INDEX_SLACK):
+        self.flows = flows
+        self.slack = slack
+        self.rebuild()
+
+    def rebuild(self):
+        self.heaps = {}
+        self.entries = 0
+        for tunnel_id, flow in self.flows.items():
+            self._push(tunnel_id, flow)
+        self.live = self.entries
+
+    def _push(self, tunnel_id, flow):
+        entry = (flow.get("priority", DEFAULT_PRIORITY), flow["bw"], tunnel_id)
+        path = flow["path"]
+        for u, v in zip(path[:-1], path[1:]):
+            heapq.heappush(self.heaps.setdefault(link_key(u, v), []), entry)
+            self.entries += 1
+
+    def add(self, tunnel_id, flow):
+        """Call after the flow table recorded tunnel_id (also after it moved)."""
+        self._push(tunnel_id, flow)
+        self.live += len(flow["path"]) - 1
+        if self.entries > 2 * self.live + self.slack:
+            self.rebuild()
+
+    def discard(self, flow):
+        """Call before the flow table releases the tunnel or moves it off flow's current path."""
+        self.live -= len(flow["path"]) - 1
+
+    def _live(self, link, entry):
+        priority, bw, tunnel_id = entry
+        flow = self.flows.get(tunnel_id)
+        if flow is None or flow["bw"] != bw or flow.get("priority", DEFAULT_PRIORITY) != priority:
+            return False
+        path = flow["path"]
+        return any(link_key(u, v) == link for u, v in zip(path[:-1], path[1:]))
+
+    def below(self, link, priority):
+        """Tunnels on link with a priority lower than priority, least important first."""
+        heap = self.heaps.get(link, [])
+        live, seen = [], set()
+        while heap and heap[0][0] < priority:
+            entry = heapq.heappop(heap)
+            if entry[2] not in seen and self._live(link, entry):
+                live.append(entry)
+                seen.add(entry[2])
+            else:
+                self.entries -= 1
+        for entry in live:
+            heapq.heappush(heap, entry)
+        return [(tunnel_id, bw) for _, bw, tunnel_id in live]
+
+def preemption_cost(victims):
+    """Preempted bandwidth (both directions), weighted so that displacing a higher class costs more."""
+    return sum((flow["bw"] + reverse_bw(flow)) * (1 + flow.get("priority", DEFAULT_PRIORITY))
+               for flow in victims.values())
+
+def choose_victims(G, index, path, bw, priority, bw_rev=None, members=None):
+    """
+    Smallest set of tunnels below priority whose release frees bw on every arc of path
+    and bw_rev (default bw) on their reverse arcs: least important (then smallest) first
+    per short arc, then redundant picks are dropped, largest first. members(tunnel_id)
+    lists the tunnels that can only be preempted together (a split group); they are
+    picked and dropped as one unit. Returns {tunnel_id: flow}, or None if path cannot
+    be cleared.
+    """
+    members = members or (lambda tunnel_id: [tunnel_id])
+    bw_rev = bw if bw_rev is None else bw_rev
+    deficit = {}
+    for u, v in zip(path[:-1], path[1:]):
+        for a, b, need in ((u, v, bw), (v, u, bw_rev)):
+            if G[a][b]['weight'] < need:
+                deficit[(a, b)] = need - G[a][b]['weight']
+
+    def freed(victims):
+        out = dict.fromkeys(deficit, 0)
+        for flow in victims.values():
+            p = flow["path"]
+            for u, v in zip(p[:-1], p[1:]):
+                if (u, v) in out:
+                    out[(u, v)] += flow["bw"]
+                if (v, u) in out:
+                    out[(v, u)] += reverse_bw(flow)
+        return out
+
+    def covered(victims):
+        return all(got >= deficit[arc] for arc, got in freed(victims).items())
+
+    victims = {}
+    for arc, need in deficit.items():
+        for tunnel_id, _ in index.below(link_key(*arc), priority):
+            if freed(victims)[arc] >= need:
+                break
+            for tid in members(tunnel_id):
+                victims.setdefault(tid, index.flows[tid])
+        if freed(victims)[arc] < need:
+            return None
+
+    units = {tuple(members(tid)) for tid in victims}
+    for unit in sorted(units, key=lambda unit: -sum(victims[tid]["bw"] for tid in unit)):
+        rest = {tid: flow for tid, flow in victims.items() if tid not in unit}
+        if covered(rest):
+            victims = rest
+    return victims
+
+# ─────────────────────────────
+# Lease Timer Wheel
+# ─────────────────────────────
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel for lease deadlines. Level l has WHEEL_SLOTS slots of
+    WHEEL_SLOTS**l ticks each; an entry sits in the coarsest level whose slot it does
+    not share with the current tick and cascades one level down when that slot comes
+    round, so scheduling is O(1) and every entry moves at most WHEEL_LEVELS times.
+
+    Cancelling or re-scheduling (renewing) a key only updates its deadline; stale
+    entries are dropped when their slot fires.
+    """
+
+    def __init__(self, tick=LEASE_TICK, slots=WHEEL_SLOTS, levels=WHEEL_LEVELS, now=None):
+        self.tick = tick
+        self.slots = slots
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.current = int((time.time() if now is None else now) // tick)
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, key, deadline):
+        """Fires key at the first tick at or after deadline; replaces any earlier deadline."""
+        self.deadlines[key] = deadline
+        self._insert(key, deadline, max(math.ceil(deadline / self.tick), self.current + 1))
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def _insert(self, key, deadline, expires_at):
+        level = 0
+        while (level < len(self.wheels) - 1
+               and expires_at // self.slots ** (level + 1) != self.current // self.slots ** (level + 1)):
+            level += 1
+        slot = (expires_at // self.slots ** level) % self.slots
+        self.wheels[level][slot].append((key, deadline, expires_at))
+
+    def advance(self, now=None):
+        """Moves the wheel up to now and returns the keys whose deadline passed."""
+        target = int((time.time() if now is None else now) // self.tick)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            # Cascade the coarser slots that start at this tick
+            for level in range(1, len(self.wheels)):
+                if self.current % self.slots ** level:
+                    break
+                slot = (self.current // self.slots ** level) % self.slots
+                entries, self.wheels[level][slot] = self.wheels[level][slot], []
+                for entry in entries:
+                    if self.deadlines.get(entry[0]) == entry[1]:
+                        self._insert(*entry)
+            slot = self.current % self.slots
+            entries, self.wheels[0][slot] = self.wheels[0][slot], []
+            for key, deadline, expires_at in entries:
+                if self.deadlines.get(key) != deadline:
+                    continue
+                if expires_at > self.current:
+                    self._insert(key, deadline, expires_at)  # beyond the top level's range
+                    continue
+                del self.deadlines[key]
+                expired.append(key)
+        return expired
+
+def start_scheduler(allocator, interval=LEASE_TICK):
+    """Background thread that opens booked windows and releases expired leases every interval seconds."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                activated, expired = allocator.tick()
+                if activated:
+                    print(f"\U0001f4c5 Activated {activated} booked slice(s)")
+                if expired:
+                    print(f"\u23f0 Released {expired} expired slice(s)")
+            except Exception as e:
+                print(f"\u274c Scheduler tick failed: {e}")
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
+
+# ─────────────────────────────
+# Advance Reservation Calendar
+# ─────────────────────────────
+
+class SlotTree:
+    """Range add / range max over time slots: a lazy segment tree, O(log n) per call."""
+
+    def __init__(self, size):
+        self.size = 1
+        while self.size < size:
+            self.size *= 2
+        # mx[node] is the max over the node's range, including the node's own pending add
+        self.mx = [0] * (2 * self.size)
+        self.add_ = [0] * (2 * self.size)
+
+    def add(self, lo, hi, delta, node=1, node_lo=0, node_hi=None):
+        """Adds delta to slots [lo, hi)."""
+        if node_hi is None:
+            node_hi = self.size
+        if hi <= node_lo or node_hi <= lo:
+            return
+        if lo <= node_lo and node_hi <= hi:
+            self.mx[node] += delta
+            self.add_[node] += delta
+            return
+        mid = (node_lo + node_hi) // 2
+        self.add(lo, hi, delta, 2 * node, node_lo, mid)
+        self.add(lo, hi, delta, 2 * node + 1, mid, node_hi)
+        self.mx[node] = self.add_[node] + max(self.mx[2 * node], self.mx[2 * node + 1])
+
+    def max(self, lo, hi, node=1, node_lo=0, node_hi=None):
+        """Largest value over slots [lo, hi)."""
+        if node_hi is None:
+            node_hi = self.size
+        if hi <= node_lo or node_hi <= lo:
+            return float('-inf')  # stored maxima exclude ancestors' adds and may be negative
+        if lo <= node_lo and node_hi <= hi:
+            return self.mx[node]
+        mid = (node_lo + node_hi) // 2
+        return self.add_[node] + max(self.max(lo, hi, 2 * node, node_lo, mid),
+                                     self.max(lo, hi, 2 * node + 1, mid, node_hi))
+
+class BandwidthCalendar:
+    """
+    Bandwidth booked on each arc over time. Time is cut into CALENDAR_SLOT slots from
+    an epoch up to CALENDAR_HORIZON ahead, and each booked arc gets a SlotTree, so the
+    peak booked bandwidth of a link direction over any window is one O(log n) query.
+    """
+
+    def __init__(self, slot=CALENDAR_SLOT, horizon=CALENDAR_HORIZON, now=None):
+        self.slot = slot
+        self.horizon = horizon
+        self.slots = int(horizon // slot)
+        self.epoch = ((time.time() if now is None else now) // slot) * slot
+        self.trees = {}
+
+    def window(self, start, end):
+        """Slot range [lo, hi) covering [start, end)."""
+        lo = max(0, int((start - self.epoch) // self.slot))
+        hi = math.ceil((end - self.epoch) / self.slot)
+        if hi > self.slots:
+            raise ValueError(f"Booking window ends beyond the {self.horizon // 3600} h calendar horizon.")
+        return lo, max(hi, lo + 1)
+
+    def add(self, path, bw, start, end, bw_rev=None):
+        """Books bw along path and bw_rev (default bw) on the reverse arcs."""
+        if end <= self.epoch:
+            return
+        bw_rev = bw if bw_rev is None else bw_rev
+        lo, hi = self.window(start, end)
+        for u, v in zip(path[:-1], path[1:]):
+            for arc, delta in (((u, v), bw), ((v, u), bw_rev)):
+                if arc not in self.trees:
+                    self.trees[arc] = SlotTree(self.slots)
+                self.trees[arc].add(lo, hi, delta)
+
+    def peak(self, u, v, start, end):
+        """Peak bandwidth booked on the u -> v arc over [start, end)."""
+        tree = self.trees.get((u, v))
+        if tree is None:
+            return 0
+        return tree.max(*self.window(start, end))
+
+# ─────────────────────────────
+# Re-optimization
+# ─────────────────────────────
+
+def admission_ratio(G, probe_bw):
+    """Share of host pairs that could still admit a probe_bw request on G (widest-path test)."""
+    hosts = sorted(n for n in G if n.startswith('h'))
+    pairs = [(a, b) for i, a in enumerate(hosts) for b in hosts[i + 1:]]
+    if not pairs:
+        return 1.0
+    index = BottleneckIndex(G)
+    return sum(index.bottleneck(a, b) >= probe_bw for a, b in pairs) / len(pairs)
+
+def place_tunnels(G0, flows, k=DEFRAG_K):
+    """
+    Greedy multi-commodity re-placement of all tunnels on the initial capacities G0:
+    largest demand first, each on the fewest-hop feasible path within its delay bound,
+    ties broken by the widest bottleneck. Tunnels that no longer fit keep their current path.
+    """
+    W = G0.copy()
+    target = {}
+    for tid, flow in sorted(flows.items(), key=lambda item: -item[1]["bw"]):
+        path, bw, bw_rev = flow["path"], flow["bw"], reverse_bw(flow)
+        paths, _ = k_shortest_paths(feasible_subgraph(W, bw, bw_rev), path[0], path[-1], k, weight=None)
+        if "max_delay" in flow:
+            paths = [p for p in paths if path_delay(W, p) <= flow["max_delay"]]
+        if paths:
+            path = min(paths, key=lambda p: (len(p), -path_headroom(W, p, 0)))
+        for u, v in zip(path[:-1], path[1:]):
+            W[u][v]['weight'] -= bw
+            W[v][u]['weight'] -= bw_rev
+        target[tid] = path
+    return target
+
+def plan_reoptimization(G, flows, G0, max_moves=DEFRAG_MAX_MOVES, probe_bw=None):
+    """
+    Plans up to max_moves tunnel migrations towards the re-placement computed on G0.
+    Each move is simulated on a copy of the live residual graph G and kept only if it
+    fits and does not lower the admission ratio. Nothing is changed on G.
+    """
+    if probe_bw is None:
+        demands = sorted(flow["bw"] for flow in flows.values())
+        probe_bw = demands[len(demands) // 2] if demands else 1
+    target = place_tunnels(G0, flows)
+
+    R = G.copy()
+    before = current = admission_ratio(R, probe_bw)
+    moves = []
+    for tid, flow in sorted(flows.items(), key=lambda item: -item[1]["bw"]):
+        if len(moves) >= max_moves:
+            break
+        old, new, bw, bw_rev = flow["path"], target[tid], flow["bw"], reverse_bw(flow)
+        if new == old:
+            continue
+        update_graph_bandwidth(R, old, -bw, -bw_rev)
+        try:
+            update_graph_bandwidth(R, new, bw, bw_rev)
+        except ValueError:
+            update_graph_bandwidth(R, old, bw, bw_rev)
+            continue
+        ratio = admission_ratio(R, probe_bw)
+        if ratio < current:
+            update_graph_bandwidth(R, new, -bw, -bw_rev)
+            update_graph_bandwidth(R, old, bw, bw_rev)
+            continue
+        current = ratio
+        moves.append({"tunnel_id": tid, "bw": bw, "bw_rev": bw_rev, "from": old, "to": new})
+
+    flowmods = sum(FLOWMODS_PER_SWITCH * (len(m["from"]) - 2 + len(m["to"]) - 2) for m in moves)
+    return {"probe_bw": probe_bw, "moves": moves, "admission_before": round(before, 3),
+            "admission_after": round(current, 3), "gain": round(current - before, 3), "flowmods": flowmods}
+
+def print_reoptimization_plan(plan):
+    print(f"\U0001f9e9 Re-optimization plan: {len(plan['moves'])} moves, {plan['flowmods']} FlowMods")
+    print(f"   Admission ratio at {plan['probe_bw']} Mbps: {plan['admission_before']} \u2192 "
+          f"{plan['admission_after']} (gain {plan['gain']:+})")
+    for m in plan["moves"]:
+        print(f"   TID {m['tunnel_id']} ({m['bw']} Mbps): {' → '.join(m['from'])}  \u21d2  {' → '.join(m['to'])}")
+
+def start_reoptimizer(allocator, interval, max_moves=DEFRAG_MAX_MOVES):
+    """Background thread that re-plans every interval seconds and applies plans with a positive gain."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                plan = allocator.reoptimize(max_moves=max_moves, apply=False)
+                if plan["gain"] > 0:
+                    print_reoptimization_plan(plan)
+                    allocator.apply_reoptimization(plan)
+            except Exception as e:
+                print(f"\u274c Re-optimization failed: {e}")
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
+
+# ─────────────────────────────
+# Candidate Path Cache
+# ─────────────────────────────
+
+class PathCache:
+    """
+    LRU cache of candidate paths keyed by (src, dst, k, policy, bw floor); the floor is
+    (bw, bw_rev) for cspf, whose candidates come from a graph pruned at that demand, and
+    None otherwise. The links never change while the allocator runs, so each entry is only
+    stamped with the capacity version it was computed at: a capacity change requires
+    revalidating the cached paths against the current residuals (done by the caller).
+    """
+
+    def __init__(self, size=PATH_CACHE_SIZE, max_age=PATH_CACHE_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self.hits = 0           # served at the same capacity version
+        self.revalidated = 0    # served after residuals changed, paths re-checked
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, capacity_version):
+        """Returns (candidates, capacity_version) or None when missing or stale."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        candidates, cap_v = entry
+        if capacity_version - cap_v > self.max_age:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return candidates, cap_v
+
+    def put(self, key, candidates, capacity_version):
+        if self.size <= 0:
+            return
+        self._entries[key] = (candidates, capacity_version)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.revalidated + self.misses
+        hit_ratio = (self.hits + self.revalidated) / lookups if lookups else 0.0
+        return {"entries": len(self._entries), "hits": self.hits, "revalidated": self.revalidated,
+                "misses": self.misses, "evictions": self.evictions, "hit_ratio": round(hit_ratio, 3)}
+
+# ─────────────────────────────
+# Flow API Client
+# ─────────────────────────────
+
+class FlowApiClient:
+    """
+    Client for the Mininet runner's flow API over one keep-alive HTTP session.
+    flow() sends a single add/delete; submit() sends many operations in one round
+    trip to /flows and returns one {"ok", "error"} result per operation.
+    """
+
+    def __init__(self, base_url=FLOW_API_URL, timeout=5, pool_size=8):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self._bulk_supported = True
+
+    @staticmethod
+    def operation(command, path, tcp_port, rate, bidirectional=True, rate_rev=None):
+        op = {
+            "command": command,
+            "path": path,
+            "tcp_port": tcp_port,
+            "rate": rate,
+            "bidirectional": bidirectional
+        }
+        if rate_rev is not None and rate_rev != rate:
+            op["rate_rev"] = rate_rev  # reverse flow of an asymmetric slice
+        return op
+
+    def flow(self, command, path, tcp_port, rate, bidirectional=True, rate_rev=None):
+        payload = self.operation(command, path, tcp_port, rate, bidirectional, rate_rev)
+        try:
+            response = self.session.post(f"{self.base_url}/flow", json=payload, timeout=self.timeout)
+            if response.ok:
+                print(f"\U0001f310 Flow API success ({command}): TCP {tcp_port}")
+                return True
+            else:
+                print(f"\u26a0\ufe0f Flow API failed ({command}): HTTP {response.status_code} - {response.text}")
+                return False
+        except Exception as e:
+            print(f"\u274c Error calling flow API ({command}): {e}")
+            return False
+
+    def submit(self, operations):
+        if not operations:
+            return []
+        if self._bulk_supported:
+            try:
+                response = self.session.post(f"{self.base_url}/flows", json={"operations": operations},
+                                             timeout=self.timeout + len(operations) * 0.05)
+            except Exception as e:
+                print(f"\u274c Error calling bulk flow API: {e}")
+                return [{"ok": False, "error": str(e)} for _ in operations]
+            if response.status_code == 404:
+                # Older runner without /flows: fall back to one request per operation
+                self._bulk_supported = False
+            else:
+                try:
+                    items = response.json()["results"]
+                except (ValueError, KeyError):
+                    error = f"HTTP {response.status_code} - {response.text}"
+                    return [{"ok": False, "error": error} for _ in operations]
+                results = [{"ok": item.get("status") == "ok", "error": item.get("error")} for item in items]
+                ok = sum(r["ok"] for r in results)
+                print(f"\U0001f310 Bulk flow API: {ok}/{len(operations)} operations applied")
+                return results
+
+        results = []
+        for op in operations:
+            ok = self.flow(**op)
+            results.append({"ok": ok, "error": None if ok else f"/flow {op['command']} failed"})
+        return results
+
+    def close(self):
+        self.session.close()
+
+# ─────────────────────────────
+# Residual Graph Persistence
+# ─────────────────────────────
+
+class DebouncedGraphWriter:
+    """
+    Keeps the in-memory residual graph authoritative and writes it to disk from a
+    background thread. mark_dirty() is O(1); bursts of updates within FLUSH_DELAY
+    are coalesced into a single CSV and snapshot rewrite. Call close() on exit to flush.
+    """
+
+    def __init__(self, G, path=RUNNING_PATH, delay=FLUSH_DELAY):
+        self.G = G
+        self.path = path
+        self.delay = delay
+        self.flushes = 0
+        self._dirty = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self):
+        self._dirty = True
+        self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            self._dirty = False
+            save_graph(self.G, self.path)
+            self.flushes += 1
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        if self._dirty:
+            self.flush()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Coalesce everything that arrives during the debounce window
+            if self._stop.wait(self.delay):
+                return
+            self._wake.clear()
+            try:
+                if self._dirty:
+                    self.flush()
+            except Exception as e:
+                print(f"\u274c Failed to persist residual graph: {e}", file=sys.stderr)
+
+# ─────────────────────────────
+# Allocation Journal
+# ─────────────────────────────
+
+class FlowStore:
+    """
+    Flow table (tunnel ID -> path, bw, tcp_port) backed by an append-only journal of
+    allocate/release events. Every SNAPSHOT_EVERY events the table and the residual
+    graph are compacted into a snapshot and the journal is truncated, so startup only
+    replays the events recorded after the last snapshot.
+    """
+
+    def __init__(self, G, journal_path=JOURNAL_PATH, snapshot_path=SNAPSHOT_PATH, snapshot_every=SNAPSHOT_EVERY):
+        self.G = G
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.flows = {}
+        self.bookings = {}  # booking ID -> future window (src, dst, path, bw, start, end[, tunnel_id])
+        self.seq = 0
+        self._since_snapshot = 0
+        self._journal = None
+        self._restore()
+
+    # ── startup ──────────────────
+
+    def _restore(self):
+        snap = self._load_snapshot()
+        if snap is None:
+            # First start on this topology: the running CSV already reflects any legacy flows
+            self.flows = load_flows_from_csv()
+            self._set_capacity()
+            self.snapshot()
+            return
+
+        for u, v, w in snap["graph"]:
+            self.G[u][v]['weight'] = w
+            if not snap.get("directed"):
+                self.G[v][u]['weight'] = w  # snapshot of the undirected model: one weight per link
+        self.flows = {int(tid): flow for tid, flow in snap["flows"].items()}
+        self.bookings = {int(bid): booking for bid, booking in snap.get("bookings", {}).items()}
+        self.seq = snap["seq"]
+        self._set_capacity()
+
+        replayed, torn = 0, False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        torn = True  # partial append from a crash; everything after it is lost
+                        break
+                    if event["seq"] <= self.seq:
+                        continue
+                    self._apply(event)
+                    self.seq = event["seq"]
+                    replayed += 1
+        # Bandwidth is taken before an event is journaled, so a release can land after the
+        # allocation that reused its bandwidth: only the end state of the replay is consistent
+        load = self._arc_load()
+        for (u, v), cap in self.capacity.items():
+            self.G[u][v]['weight'] = cap - load[(u, v)]
+        print(f"\U0001f4d2 Restored {len(self.flows)} flows (snapshot seq {snap['seq']}, replayed {replayed} events)")
+        # Compact right away so the next start does not replay the same tail again
+        if replayed or torn:
+            self.snapshot()
+        else:
+            self._journal = open(self.journal_path, 'a')
+
+    def _arc_load(self):
+        """Bandwidth the recorded flows take on each arc."""
+        load = defaultdict(int)
+        for flow in self.flows.values():
+            path, bw, bw_rev = flow["path"], flow["bw"], reverse_bw(flow)
+            for u, v in zip(path[:-1], path[1:]):
+                load[(u, v)] += bw
+                load[(v, u)] += bw_rev
+        return load
+
+    def _set_capacity(self):
+        # Residuals only move with the flows, so residual + recorded load stays fixed per arc
+        load = self._arc_load()
+        self.capacity = {(u, v): d['weight'] + load[(u, v)] for u, v, d in self.G.edges(data=True)}
+
+    def _load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path) as f:
+            snap = json.load(f)
+        snap_links = {frozenset((u, v)) for u, v, _ in snap["graph"]}
+        if snap_links != {frozenset(e) for e in self.G.edges()}:
+            print("\u26a0\ufe0f Snapshot does not match the running topology; starting a fresh journal.")
+            return None
+        return snap
+
+    def _apply(self, event):
+        if event["op"] == "allocate":
+            self.flows[event["tunnel_id"]] = self._flow(
+                event["path"], event["bw"], event["tcp_port"], event.get("group"),
+                event.get("priority", DEFAULT_PRIORITY), event.get("expires"), event.get("bw_rev"),
+                event.get("max_delay"))
+        elif event["op"] == "release":
+            self.flows.pop(event["tunnel_id"])
+        elif event["op"] == "move":
+            self.flows[event["tunnel_id"]]["path"] = event["path"]
+        elif event["op"] == "renew":
+            self._set_expiry(self.flows[event["tunnel_id"]], event["expires"])
+        elif event["op"] == "book":
+            self.bookings[event["booking_id"]] = event["booking"]
+        elif event["op"] == "activate":
+            self.bookings[event["booking_id"]].update(tunnel_id=event["tunnel_id"], path=event["path"])
+        elif event["op"] == "unbook":
+            self.bookings.pop(event["booking_id"])
+
+    # ── runtime ──────────────────
+
+    @staticmethod
+    def _flow(path, bw, tcp_port, group=None, priority=DEFAULT_PRIORITY, expires=None, bw_rev=None, max_delay=None):
+        flow = {"path": path, "bw": bw, "tcp_port": tcp_port}
+        if bw_rev is not None and bw_rev != bw:
+            flow["bw_rev"] = bw_rev  # return direction of an asymmetric slice
+        if max_delay is not None:
+            flow["max_delay"] = max_delay  # latency bound (ms) kept across re-routes
+        if group is not None:
+            flow["group"] = group  # subflow of a split allocation, keyed by its first tunnel ID
+        if priority != DEFAULT_PRIORITY:
+            flow["priority"] = priority
+        FlowStore._set_expiry(flow, expires)
+        return flow
+
+    @staticmethod
+    def _set_expiry(flow, expires):
+        if expires is None:
+            flow.pop("expires", None)
+        else:
+            flow["expires"] = expires  # lease deadline, Unix time
+
+    def record_allocate(self, tunnel_id, path, bw, tcp_port, group=None, priority=DEFAULT_PRIORITY, expires=None,
+                        bw_rev=None, max_delay=None):
+        self.flows[tunnel_id] = flow = self._flow(path, bw, tcp_port, group, priority, expires, bw_rev, max_delay)
+        self._append({"op": "allocate", "tunnel_id": tunnel_id, **flow})
+
+    def record_move(self, tunnel_id, path):
+        """Same tunnel (ID, port, bandwidth, attributes) re-routed onto path."""
+        self.flows[tunnel_id]["path"] = path
+        self._append({"op": "move", "tunnel_id": tunnel_id, "path": path})
+
+    def record_renew(self, tunnel_id, expires):
+        self._set_expiry(self.flows[tunnel_id], expires)
+        self._append({"op": "renew", "tunnel_id": tunnel_id, "expires": expires})
+
+    def record_book(self, booking_id, booking):
+        self.bookings[booking_id] = booking
+        self._append({"op": "book", "booking_id": booking_id, "booking": booking})
+
+    def record_activate(self, booking_id, tunnel_id, path):
+        """The booked window opened and is now carried by tunnel_id (on path)."""
+        self.bookings[booking_id].update(tunnel_id=tunnel_id, path=path)
+        self._append({"op": "activate", "booking_id": booking_id, "tunnel_id": tunnel_id, "path": path})
+
+    def record_unbook(self, booking_id):
+        self.bookings.pop(booking_id)
+        self._append({"op": "unbook", "booking_id": booking_id})
+
+    def group_members(self, tunnel_id):
+        """Tunnel IDs of every subflow sharing tunnel_id's split group (just tunnel_id otherwise)."""
+        group = self.flows[tunnel_id].get("group")
+        if group is None:
+            return [tunnel_id]
+        return sorted(tid for tid, flow in self.flows.items() if flow.get("group") == group)
+
+    def record_release(self, tunnel_id):
+        self.flows.pop(tunnel_id)
+        self._append({"op": "release", "tunnel_id": tunnel_id})
+
+    def _append(self, event):
+        self.seq += 1
+        event["seq"] = self.seq
+        self._journal.write(json.dumps(event) + "\n")
+        self._journal.flush()
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        Atomically writes flows + residual graph, then truncates the journal. The residuals
+        are derived from the recorded flows rather than read from G, which may already
+        hold reservations whose events are not journaled yet (they would apply twice on replay).
+        """
+        load = self._arc_load()
+        snap = {
+            "seq": self.seq,
+            "flows": self.flows,
+            "bookings": self.bookings,
+            "directed": True,
+            "graph": [[u, v, cap - load[(u, v)]] for (u, v), cap in self.capacity.items()],
+        }
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(snap, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # Events already covered by the snapshot are skipped on replay, so a crash
+        # between the rename and the truncate is harmless
+        if self._journal:
+            self._journal.close()
+        self._journal = open(self.journal_path, 'w')
+        self._since_snapshot = 0
+        # Human-readable export of the current flow table
+        save_flows_to_csv(self.flows)
+
+    def close(self):
+        if self._journal:
+            self.snapshot()
+            self._journal.close()
+            self._journal = None
+
+# ─────────────────────────────
+# Allocation Engine
 # ─────────────────────────────
 
-def interactive_loop(viz1, viz2):
-    G = load_graph_from_csv(RUNNING_PATH)
-    while True:
-        print("\nOptions:")
-        print("1 - Allocate flow")
-        print("2 - Deallocate flow")
-        print("3 - Exit")
-        choice = input("Choice: ").strip()
+class SliceAllocator:
+    """
+    Path selection and commit logic shared by the interactive menu, batch mode and the
+    allocator service. allocate()/deallocate() raise ValueError when a request is rejected.
+
+    Safe to call from several threads: path search runs without locks, then the
+    reservation takes per-link locks (in a fixed order) and re-validates the residuals
+    before subtracting, so requests on disjoint paths commit in parallel and a request
+    that lost a race simply re-selects. Shared bookkeeping (IDs, journal, cache,
+    indexes) sits behind one short-held lock, and flow API calls hold no lock at all.
+    """
+
+    def __init__(self, G, use_api=True, cache_size=PATH_CACHE_SIZE, default_policy=DEFAULT_POLICY,
+                 api_pool_size=SERVICE_WORKERS, split=False):
+        self.G = G
+        self.default_policy = default_policy
+        self.split = split
+        self.api = FlowApiClient(pool_size=api_pool_size) if use_api else None
+        self.conflicts = 0
+        self._lock = threading.RLock()
+        self._busy = set()
+        self._link_locks = {}
+        for u, v in G.edges():
+            # One lock per link guards both of its arcs
+            if (u, v) not in self._link_locks:
+                self._link_locks[(u, v)] = self._link_locks[(v, u)] = (len(self._link_locks), threading.Lock())
+        self.cache = PathCache(cache_size)
+        # Stamp for cached paths, bumped on every residual bandwidth update
+        self.capacity_version = 0
+        # Restores the flow table and residual weights in G from snapshot + journal
+        self.store = FlowStore(G)
+        self.writer = DebouncedGraphWriter(G)
+        self.writer.mark_dirty()
+        self.ids = TunnelIdAllocator(self.store.flows)
+        self.edges = EdgeIndex(G) if np else None
+        self.bottleneck = BottleneckIndex(G)
+        self.preemption = PreemptionIndex(self.store.flows)
+        self.preemptions = 0
+        self.leases = TimerWheel()
+        for tid, flow in self.store.flows.items():
+            if "expires" in flow:
+                self.leases.schedule(tid, flow["expires"])
+        self.expired = 0
+        # Advance reservations: booked windows wait on their own wheel until they open
+        self.activations = TimerWheel()
+        self._booking_tunnels = {}
+        self._load_bookings(time.time())
+
+    def _load_bookings(self, now):
+        """(Re)builds the calendar from the stored bookings, starting a fresh epoch at now."""
+        self.calendar = BandwidthCalendar(now=now)
+        self.active_booked = {}
+        for booking_id, booking in self.store.bookings.items():
+            if booking["end"] > now:
+                self.calendar.add(booking["path"], booking["bw"], max(booking["start"], now), booking["end"],
+                                  reverse_bw(booking))
+            tunnel_id = booking.get("tunnel_id")
+            if tunnel_id is None:
+                self.activations.schedule(booking_id, booking["start"])
+            elif tunnel_id in self.store.flows:
+                self._booking_tunnels[tunnel_id] = booking_id
+                self._count_active(booking, 1)
+        self.next_booking = max(self.store.bookings, default=0) + 1
+
+    def _held(self, until=None, exclude=None):
+        """
+        Bandwidth per arc that pending bookings need at some point before until (Unix
+        time; None means the calendar horizon, as for a tunnel without lease), beyond
+        what open bookings already hold in the residuals. Immediate allocations must
+        leave it free. exclude is a booking being activated: its own share is not held.
+        """
+        now = time.time()
+        with self._lock:
+            calendar = self.calendar
+            end = min(until or float('inf'), calendar.epoch + calendar.slots * calendar.slot)
+            held = {}
+            if end > now:
+                for u, v in calendar.trees:
+                    amount = calendar.peak(u, v, now, end) - self.active_booked.get((u, v), 0)
+                    if amount > 0:
+                        held[(u, v)] = amount
+        if exclude is not None and held:
+            path = exclude["path"]
+            for u, v in zip(path[:-1], path[1:]):
+                for arc, bw in (((u, v), exclude["bw"]), ((v, u), reverse_bw(exclude))):
+                    if arc in held:
+                        held[arc] -= bw
+            held = {arc: amount for arc, amount in held.items() if amount > 0}
+        return held
+
+    def _without_held(self, held):
+        """The residual graph, or a copy of it with the held bandwidth taken out."""
+        if not held:
+            return self.G
+        W = self.G.copy()
+        for (u, v), amount in held.items():
+            W[u][v]['weight'] -= amount
+        return W
+
+    def _count_active(self, booking, sign):
+        path = booking["path"]
+        for u, v in zip(path[:-1], path[1:]):
+            for arc, bw in (((u, v), booking["bw"]), ((v, u), reverse_bw(booking))):
+                self.active_booked[arc] = self.active_booked.get(arc, 0) + sign * bw
+
+    def close(self):
+        self.writer.close()
+        self.store.close()
+        if self.api:
+            self.api.close()
+
+    # ── allocation phases ────────
+
+    @staticmethod
+    def _check_bw(bw, bw_rev=None):
+        # A non-positive demand would add capacity on release-style updates and admit nothing real
+        if bw <= 0:
+            raise ValueError("Bandwidth must be a positive number of Mbps.")
+        if bw_rev is not None and bw_rev < 0:
+            raise ValueError("Reverse bandwidth cannot be negative.")
+
+    def _check_request(self, src, dst, policy):
+        policy = policy or self.default_policy
+        if src not in self.G or dst not in self.G:
+            raise ValueError("Invalid nodes.")
+        if policy not in PATH_POLICIES:
+            raise ValueError(f"Unknown path policy '{policy}'.")
+        return policy
+
+    def _select(self, src, dst, bw, k, policy, bw_rev=None, max_delay=None, held=None):
+        policy = self._check_request(src, dst, policy)
+        bw_rev = bw if bw_rev is None else bw_rev
+
+        # Reject right away if even the widest path cannot carry the request
+        with self._lock:
+            if not self.bottleneck.can_admit(src, dst, max(bw, bw_rev)):
+                raise ValueError(f"No path with {bw} Mbps of residual bandwidth between nodes "
+                                 f"(widest path: {self.bottleneck.bottleneck(src, dst)} Mbps).")
+
+        # Bandwidth promised to pending bookings (held) is off limits
+        G = self.G
+
+        # A latency bound overrides the policy: cheapest path within max_delay ms
+        if max_delay is not None:
+            G = self._without_held(held)
+            path, stats = delay_constrained_path(G, src, dst, bw, max_delay, bw_rev)
+            print(f"\u23f1\ufe0f Delay-bounded search ({stats['stop']}) took {stats['larac_iterations']} LARAC steps "
+                  f"and {stats['examined']} labels in {stats['elapsed_ms']} ms")
+            if path is None:
+                raise ValueError(f"No path with {bw} Mbps of residual bandwidth within {max_delay} ms between nodes.")
+            min_seg = path_headroom(G, path, bw, bw_rev)
+            print(f"\u2705 Selected path: {path} | Delay: {stats['delay_ms']} ms | Min segmentation: {min_seg}")
+            return path, min_seg, stats
+
+        # Single-pass routing policies: one modified Dijkstra, no enumeration or cache
+        if policy in ROUTING_POLICIES:
+            G = self._without_held(held)
+            path, stats = ROUTING_POLICIES[policy].find_path(G, src, dst, bw, bw_rev)
+            print(f"\U0001f9ed {policy} search settled {stats['examined']} nodes in {stats['elapsed_ms']} ms")
+            if path is None:
+                raise ValueError(f"No path with {bw} Mbps of residual bandwidth between nodes.")
+            min_seg = path_headroom(G, path, bw, bw_rev)
+            print(f"\u2705 Selected path: {path} | Min segmentation: {min_seg}")
+            return path, min_seg, stats
 
-        if choice == '1':
-            src = input("Source node: ").strip()
-            dst = input("Destination node: ").strip()
-            if src not in G or dst not in G:
-                print("Invalid nodes.")
+        # Reuse cached candidates for this host pair if one still fits the current residuals
+        key = (src, dst, k, policy, (bw, bw_rev) if policy == 'cspf' else None)
+        with self._lock:
+            cached = self.cache.get(key, self.capacity_version)
+            if cached is not None:
+                candidates, cap_v = cached
+                try:
+                    best_path, min_seg = self._score(candidates, bw, bw_rev, held)
+                except ValueError:
+                    pass
+                else:
+                    if cap_v == self.capacity_version:
+                        self.cache.hits += 1
+                    else:
+                        self.cache.revalidated += 1
+                    print(f"\u2705 Selected cached path: {best_path} | Min segmentation: {min_seg}")
+                    return best_path, min_seg, {"examined": 0, "elapsed_ms": 0.0, "stop": "cache", "cache": "hit"}
+            self.cache.misses += 1
+            cap_v = self.capacity_version
+
+        # Get K-shortest paths (lazy, budgeted; pruned by bandwidth in cspf mode)
+        paths, stats = find_candidate_paths(G, src, dst, k, bw, policy, bw_rev)
+        stats["cache"] = "miss"
+        print(f"\U0001f50d Examined {stats['examined']} candidate paths in {stats['elapsed_ms']} ms (stop: {stats['stop']})")
+        if not paths:
+            if stats["stop"] == "infeasible":
+                raise ValueError(f"No path with {bw} Mbps of residual bandwidth between nodes.")
+            raise ValueError("No paths found between nodes.")
+        candidates = self._candidates(paths)
+        with self._lock:
+            self.cache.put(key, candidates, cap_v)
+
+        for i, p in enumerate(paths, 1):
+            cost = sum(G[u][v]['weight'] for u, v in zip(p[:-1], p[1:]))
+            print(f"{i}: {p} | Cost: {cost}")
+
+        # Try Yen-style segmentation-aware selection
+        try:
+            best_path, min_seg = self._score(candidates, bw, bw_rev, held)
+        except ValueError:
+            if not held:
+                raise
+            # Every candidate crosses booked bandwidth: search again around it (not cached)
+            paths, stats = find_candidate_paths(self._without_held(held), src, dst, k, bw, policy, bw_rev)
+            print(f"\U0001f50d Examined {stats['examined']} candidate paths around booked bandwidth "
+                  f"in {stats['elapsed_ms']} ms (stop: {stats['stop']})")
+            if not paths:
+                raise ValueError(f"No path with {bw} Mbps of residual bandwidth left by pending bookings.")
+            best_path, min_seg = least_segmentation(self.G, paths, bw, bw_rev, held)
+        print(f"\u2705 Selected path: {best_path} | Min segmentation: {min_seg}")
+        return best_path, min_seg, stats
+
+    def _candidates(self, paths):
+        """Pairs paths with their arc-column rows (both directions) so they can be re-scored without Python loops."""
+        if not self.edges:
+            return paths, None, None
+        return paths, self.edges.path_rows(paths), self.edges.path_rows([p[::-1] for p in paths])
+
+    def _score(self, candidates, bw, bw_rev, held=None):
+        paths, rows, rev_rows = candidates
+        if rows is None:
+            return least_segmentation(self.G, paths, bw, bw_rev, held)
+        return least_segmentation_vectorized(self.edges, paths, rows, bw, rev_rows, bw_rev, held)
+
+    @contextlib.contextmanager
+    def _locked_links(self, *paths):
+        """Holds the locks of every link on the paths, always acquired in the same global order."""
+        locks = sorted({self._link_locks[e] for path in paths for e in zip(path[:-1], path[1:])},
+                       key=lambda entry: entry[0])
+        for _, lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for _, lock in reversed(locks):
+                lock.release()
+
+    def _apply_bw(self, path, bw_delta, rev_delta=None, held=None):
+        self._apply_bw_many([(path, bw_delta, bw_delta if rev_delta is None else rev_delta)], held)
+
+    def _apply_bw_many(self, changes, held=None):
+        """
+        Applies [(path, bw_delta, rev_delta), ...] in order as one step: either all of them
+        or none. With held ({arc: Mbps} promised to bookings, see _held) the arcs that take
+        bandwidth must keep at least that much residual.
+        """
+        # Validate-and-subtract under the link locks acts as a compare-and-swap on the residuals
+        with self._locked_links(*(path for path, _, _ in changes)):
+            done = []
+            try:
+                for path, bw_delta, rev_delta in changes:
+                    update_graph_bandwidth(self.G, path, bw_delta, rev_delta)
+                    done.append((path, bw_delta, rev_delta))
+                if held:
+                    taken = {arc for path, bw_delta, _ in changes if bw_delta > 0
+                             for u, v in zip(path[:-1], path[1:]) for arc in ((u, v), (v, u))}
+                    if any(self.G[u][v]['weight'] < held.get((u, v), 0) for u, v in taken):
+                        raise ValueError("Bandwidth on the path is booked for a pending reservation.")
+            except ValueError:
+                for path, bw_delta, rev_delta in reversed(done):
+                    update_graph_bandwidth(self.G, path, -bw_delta, -rev_delta)
+                raise
+            if self.edges:
+                for path, bw_delta, rev_delta in changes:
+                    self.edges.update(path, bw_delta, rev_delta)
+        with self._lock:
+            for path, bw_delta, rev_delta in changes:
+                # Both deltas share a sign: reserved or released in both directions
+                self.bottleneck.update(path, bw_delta + rev_delta)
+            self.capacity_version += 1
+        self.writer.mark_dirty()
+
+    def _reserve(self, path, bw, bw_rev=None, held=None):
+        """Takes the bandwidth and a tunnel ID before the API call; undone by _rollback."""
+        bw_rev = bw if bw_rev is None else bw_rev
+        self._apply_bw(path, bw, bw_rev, held)
+        try:
+            with self._lock:
+                return self.ids.allocate()
+        except ValueError:
+            self._apply_bw(path, -bw, -bw_rev)
+            raise
+
+    def _select_and_reserve(self, src, dst, bw, k, policy, bw_rev=None, max_delay=None, until=None, exclude=None):
+        """
+        Optimistic admission: search without locks, re-select if a concurrent commit won
+        the links. Bandwidth booked before until (see _held) is left alone.
+        """
+        for attempt in range(RESERVE_RETRIES):
+            held = self._held(until, exclude)
+            best_path, min_seg, stats = self._select(src, dst, bw, k, policy, bw_rev, max_delay, held)
+            try:
+                tunnel_id, tcp_port = self._reserve(best_path, bw, bw_rev, held)
+            except ValueError:
+                if attempt == RESERVE_RETRIES - 1:
+                    raise
+                with self._lock:
+                    self.conflicts += 1
                 continue
+            return best_path, min_seg, stats, tunnel_id, tcp_port
+
+    def _rollback(self, tunnel_id, path, bw, bw_rev=None):
+        self._apply_bw(path, -bw, None if bw_rev is None else -bw_rev)
+        with self._lock:
+            self.ids.release(tunnel_id)
+
+    def _commit(self, tunnel_id, path, bw, tcp_port, group=None, priority=DEFAULT_PRIORITY, lease=None, bw_rev=None,
+                max_delay=None):
+        expires = round(time.time() + lease, 3) if lease else None
+        with self._lock:
+            self.store.record_allocate(tunnel_id, path, bw, tcp_port, group, priority, expires, bw_rev, max_delay)
+            self.preemption.add(tunnel_id, self.store.flows[tunnel_id])
+            if expires is not None:
+                self.leases.schedule(tunnel_id, expires)
+        print(f"\u2713 Flow saved (Tunnel ID {tunnel_id}, TCP Port {tcp_port})")
+
+    def _claim(self, tunnel_id):
+        """Marks a tunnel as being torn down so concurrent deallocations do not race on it."""
+        with self._lock:
+            flow = self.store.flows.get(tunnel_id)
+            if flow is None or tunnel_id in self._busy:
+                raise ValueError("Tunnel ID not found.")
+            self._busy.add(tunnel_id)
+            return flow
+
+    def _unclaim(self, tunnel_id):
+        with self._lock:
+            self._busy.discard(tunnel_id)
+
+    def _release(self, tunnel_id):
+        flow = self.store.flows[tunnel_id]
+        self._apply_bw(flow["path"], -flow["bw"], -reverse_bw(flow))
+        with self._lock:
+            self.preemption.discard(flow)
+            self.store.record_release(tunnel_id)
+            self.leases.cancel(tunnel_id)
+            self.ids.release(tunnel_id)
+            self._busy.discard(tunnel_id)
+            booking_id = self._booking_tunnels.pop(tunnel_id, None)
+            if booking_id is not None:
+                self._drop_booking(booking_id)
+        print(f"\u2713 Deallocated flow with TCP {flow['tcp_port']}")
+        return {"tunnel_id": tunnel_id, "tcp_port": flow["tcp_port"], "path": flow["path"], "bw": flow["bw"]}
 
-            k = int(input("K (number of paths): ").strip())
-            bw = int(input("Bandwidth to allocate (Mbps): ").strip())
+    # ── public API ───────────────
 
+    def allocate(self, src, dst, bw, k=DEFAULT_K, policy=None, split=None, priority=DEFAULT_PRIORITY, lease=None,
+                 bw_rev=None, max_delay=None):
+        """
+        Admits bw from src to dst on one path, with bw_rev (default bw) for the return
+        direction and, with max_delay, at most that many ms end to end. When no path fits,
+        falls back to allocate_split() (with split, for symmetric unbounded requests) and
+        then to preempting lower-priority tunnels (priority above the default). With a
+        lease (seconds) the tunnel is released when it expires unless renewed.
+        """
+        if not DEFAULT_PRIORITY <= priority <= MAX_PRIORITY:
+            raise ValueError(f"Priority must be between {DEFAULT_PRIORITY} and {MAX_PRIORITY}.")
+        self._check_bw(bw, bw_rev)
+        bw_rev = bw if bw_rev is None else bw_rev
+        try:
+            best_path, min_seg, stats, tunnel_id, tcp_port = self._select_and_reserve(
+                src, dst, bw, k, policy, bw_rev, max_delay, lease_end(lease))
+        except ValueError as e:
+            return self._fallback(e, src, dst, bw, k, policy, split, priority, lease, bw_rev, max_delay)
+
+        # Only commit if the flow API accepted it
+        if self.api and not self.api.flow("add", best_path, tcp_port, bw, rate_rev=bw_rev):
+            self._rollback(tunnel_id, best_path, bw, bw_rev)
+            raise RuntimeError("Flow API failed. Aborting allocation.")
+
+        self._commit(tunnel_id, best_path, bw, tcp_port, priority=priority, lease=lease, bw_rev=bw_rev,
+                     max_delay=max_delay)
+        return {"tunnel_id": tunnel_id, "tcp_port": tcp_port, "path": best_path,
+                "min_seg": min_seg, "search": stats}
+
+    def _fallback(self, error, src, dst, bw, k, policy, split, priority, lease=None, bw_rev=None, max_delay=None):
+        """Second chances for a request no single path can carry; re-raises error if none applies."""
+        self._check_request(src, dst, policy)  # invalid requests stay rejected
+        bw_rev = bw if bw_rev is None else bw_rev
+        if (self.split if split is None else split) and bw_rev == bw and max_delay is None:
+            print(f"\U0001f500 No single path fits; splitting the demand across up to {MAX_SUBFLOWS} paths")
             try:
-                # Step 1: Get K-shortest paths
-                paths = list(nx.shortest_simple_paths(G, src, dst, weight='weight'))[:k]
-                if not paths:
-                    print("\u274c No paths found between nodes.")
+                return self.allocate_split(src, dst, bw, priority=priority, lease=lease)
+            except ValueError as split_error:
+                error = split_error
+        if priority > DEFAULT_PRIORITY:
+            print(f"\u26a1 No room left; looking for tunnels below priority {priority} to preempt")
+            return self.allocate_preempting(src, dst, bw, k, priority, lease, bw_rev, max_delay)
+        raise error
+
+    def _plan_preemption(self, src, dst, bw, k, priority, bw_rev, max_delay=None, held=None):
+        """Picks the candidate path whose victims cost least and claims those victims."""
+        V = self._without_held(held)
+        with self._lock:
+            # Candidate paths on the residuals as they would be without any lower-priority tunnel
+            W = V.copy()
+            for flow in self.store.flows.values():
+                if flow.get("priority", DEFAULT_PRIORITY) < priority:
+                    p = flow["path"]
+                    for u, v in zip(p[:-1], p[1:]):
+                        W[u][v]['weight'] += flow["bw"]
+                        W[v][u]['weight'] += reverse_bw(flow)
+            paths, _ = find_candidate_paths(W, src, dst, k, bw, 'cspf', bw_rev)
+            if max_delay is not None:
+                paths = [p for p in paths if path_delay(W, p) <= max_delay]
+                bounded, _ = delay_constrained_path(W, src, dst, bw, max_delay, bw_rev)
+                if bounded and bounded not in paths:
+                    paths.append(bounded)
+
+            best = None
+            for path in paths:
+                victims = choose_victims(V, self.preemption, path, bw, priority, bw_rev,
+                                         self.store.group_members)
+                # Booked windows are guarantees: they are neither preempted nor re-routed
+                if victims is None or any(tid in self._busy or tid in self._booking_tunnels for tid in victims):
                     continue
+                key = (preemption_cost(victims), len(victims), len(path))
+                if best is None or key < best[0]:
+                    best = (key, path, victims)
+            if best is None:
+                raise ValueError(f"No path can be cleared for {bw} Mbps by preempting tunnels below priority {priority}.")
+            _, path, victims = best
+            self._busy.update(victims)
+            return path, victims
 
-                for i, p in enumerate(paths, 1):
-                    cost = sum(G[u][v]['weight'] for u, v in zip(p[:-1], p[1:]))
-                    print(f"{i}: {p} | Cost: {cost}")
+    def allocate_preempting(self, src, dst, bw, k=DEFAULT_K, priority=DEFAULT_PRIORITY, lease=None, bw_rev=None,
+                            max_delay=None):
+        """
+        Admits a request that does not fit by preempting lower-priority tunnels on the
+        candidate path where that is cheapest. Preempted tunnels are re-routed when they
+        still fit elsewhere and dropped otherwise; the subflows of a split group are
+        preempted, and dropped, together. Their deletes, the new tunnel and the re-routes
+        go to the flow API as one batch.
+        """
+        self._check_bw(bw, bw_rev)
+        bw_rev = bw if bw_rev is None else bw_rev
+        held = self._held(lease_end(lease))
+        path, victims = self._plan_preemption(src, dst, bw, k, priority, bw_rev, max_delay, held)
+        freed = [(flow["path"], -flow["bw"], -reverse_bw(flow)) for flow in victims.values()]
+        try:
+            self._apply_bw_many(freed + [(path, bw, bw_rev)], held)
+        except ValueError:
+            for tid in victims:
+                self._unclaim(tid)
+            raise ValueError("Residuals changed while planning the preemption; request not admitted.")
+        try:
+            with self._lock:
+                tunnel_id, tcp_port = self.ids.allocate()
+        except ValueError:
+            self._apply_bw_many([(path, -bw, -bw_rev)] + [(p, -delta, -rev) for p, delta, rev in freed])
+            for tid in victims:
+                self._unclaim(tid)
+            raise
 
-                # Step 2: Try Yen-style segmentation-aware selection
+        # Re-route the victims on what is left, most important first
+        reroutes = {}
+        for tid, flow in sorted(victims.items(), key=lambda item: (-item[1].get("priority", DEFAULT_PRIORITY), -item[1]["bw"])):
+            try:
+                victim_held = self._held(flow.get("expires"))
+                new_path, _, _ = self._select(flow["path"][0], flow["path"][-1], flow["bw"], DEFAULT_K, None,
+                                              reverse_bw(flow), flow.get("max_delay"), victim_held)
+                self._apply_bw(new_path, flow["bw"], reverse_bw(flow), victim_held)
+                reroutes[tid] = new_path
+            except ValueError:
+                print(f"\u26a0\ufe0f TID {tid} has no other path and will be dropped")
+        # A split group only carries its demand whole: if one subflow has to go, all of them do
+        stranded = {flow.get("group") for tid, flow in victims.items() if tid not in reroutes} - {None}
+        for tid in [tid for tid in reroutes if victims[tid].get("group") in stranded]:
+            self._apply_bw(reroutes.pop(tid), -victims[tid]["bw"], -reverse_bw(victims[tid]))
+
+        ops = [FlowApiClient.operation("delete", flow["path"], flow["tcp_port"], flow["bw"]) for flow in victims.values()]
+        ops.append(FlowApiClient.operation("add", path, tcp_port, bw, rate_rev=bw_rev))
+        ops += [FlowApiClient.operation("add", new_path, victims[tid]["tcp_port"], victims[tid]["bw"],
+                                        rate_rev=reverse_bw(victims[tid]))
+                for tid, new_path in reroutes.items()]
+        results = self.api.submit(ops) if self.api else [{"ok": True, "error": None}] * len(ops)
+        n = len(victims)
+        reroute_results = dict(zip(reroutes, results[n + 1:]))
+
+        if not all(res["ok"] for res in results[:n + 1]):
+            # Put the switches and the residuals back the way they were; deletes match on
+            # the host pair and port, so re-routes must go before the victims are re-added
+            undo = [FlowApiClient.operation("delete", new_path, victims[tid]["tcp_port"], victims[tid]["bw"])
+                    for tid, new_path in reroutes.items() if reroute_results[tid]["ok"]]
+            if results[n]["ok"]:
+                undo.append(FlowApiClient.operation("delete", path, tcp_port, bw))
+            undo += [FlowApiClient.operation("add", flow["path"], flow["tcp_port"], flow["bw"],
+                                             rate_rev=reverse_bw(flow))
+                     for flow, res in zip(victims.values(), results) if res["ok"]]
+            if undo:
+                self.api.submit(undo)
+            self._apply_bw_many([(p, -victims[tid]["bw"], -reverse_bw(victims[tid])) for tid, p in reroutes.items()]
+                                + [(path, -bw, -bw_rev)])
+            self._apply_bw_many([(flow["path"], flow["bw"], reverse_bw(flow)) for flow in victims.values()])
+            with self._lock:
+                self.ids.release(tunnel_id)
+            for tid in victims:
+                self._unclaim(tid)
+            raise RuntimeError(f"Flow API failed: {next(res['error'] for res in results[:n + 1] if not res['ok'])}")
+
+        self._commit(tunnel_id, path, bw, tcp_port, priority=priority, lease=lease, bw_rev=bw_rev,
+                     max_delay=max_delay)
+        # Same rule when a subflow's re-route failed at the switches: take its installed siblings down too
+        failed = {tid for tid in reroutes if not reroute_results[tid]["ok"]}
+        stranded = {victims[tid].get("group") for tid in failed} - {None}
+        failed |= {tid for tid in reroutes if victims[tid].get("group") in stranded}
+        undo = [FlowApiClient.operation("delete", reroutes[tid], victims[tid]["tcp_port"], victims[tid]["bw"])
+                for tid in failed if reroute_results[tid]["ok"]]
+        if undo:
+            self.api.submit(undo)
+        preempted = []
+        for tid, flow in victims.items():
+            new_path = reroutes.get(tid)
+            if tid in failed:
+                self._apply_bw(new_path, -flow["bw"], -reverse_bw(flow))
+                new_path = None
+            with self._lock:
+                self.preemption.discard(flow)
+                if new_path:
+                    self.store.record_move(tid, new_path)
+                    self.preemption.add(tid, self.store.flows[tid])
+                else:
+                    self.store.record_release(tid)
+                    self.leases.cancel(tid)
+                    self.ids.release(tid)
+                self._busy.discard(tid)
+                self.preemptions += 1
+            preempted.append({"tunnel_id": tid, "tcp_port": flow["tcp_port"], "rerouted": new_path})
+            if "group" in flow:
+                preempted[-1]["group"] = flow["group"]
+            print(f"\u26a1 Preempted TID {tid} ({flow['bw']} Mbps): "
+                  + (f"re-routed via {' → '.join(new_path)}" if new_path else "dropped"))
+        return {"tunnel_id": tunnel_id, "tcp_port": tcp_port, "path": path, "priority": priority,
+                "preempted": preempted}
+
+    def allocate_split(self, src, dst, bw, max_subflows=MAX_SUBFLOWS, priority=DEFAULT_PRIORITY, lease=None):
+        """
+        Admits bw as up to max_subflows subflows on different paths. Every subflow is a
+        tunnel with its own TCP port (so the controller installs plain per-port matches)
+        tagged with the group ID of the first one; all of them are admitted or none.
+        Shares are symmetric: each subflow takes the same bandwidth in both directions.
+        """
+        if src not in self.G or dst not in self.G:
+            raise ValueError("Invalid nodes.")
+        self._check_bw(bw)
+        for attempt in range(RESERVE_RETRIES):
+            held = self._held(lease_end(lease))
+            parts = split_demand(self._without_held(held), src, dst, bw, max_subflows)
+            if parts is None:
+                raise ValueError(f"{bw} Mbps does not fit on {max_subflows} paths between nodes.")
+            reserved = []
+            try:
+                for path, share in parts:
+                    tunnel_id, tcp_port = self._reserve(path, share, held=held)
+                    reserved.append((tunnel_id, tcp_port, path, share))
+            except ValueError:
+                for tunnel_id, _, path, share in reserved:
+                    self._rollback(tunnel_id, path, share)
+                if attempt == RESERVE_RETRIES - 1:
+                    raise
+                with self._lock:
+                    self.conflicts += 1
+                continue
+            break
+
+        ops = [FlowApiClient.operation("add", path, port, share) for _, port, path, share in reserved]
+        results = self.api.submit(ops) if self.api else [{"ok": True, "error": None}] * len(ops)
+        errors = [res["error"] for res in results if not res["ok"]]
+        if errors:
+            installed = [FlowApiClient.operation("delete", path, port, share)
+                         for (_, port, path, share), res in zip(reserved, results) if res["ok"]]
+            if installed:
+                self.api.submit(installed)
+            for tunnel_id, _, path, share in reserved:
+                self._rollback(tunnel_id, path, share)
+            raise RuntimeError(f"Flow API failed: {errors[0]}")
+
+        group = reserved[0][0]
+        subflows = []
+        for tunnel_id, tcp_port, path, share in reserved:
+            self._commit(tunnel_id, path, share, tcp_port, group, priority, lease)
+            subflows.append({"tunnel_id": tunnel_id, "tcp_port": tcp_port, "path": path, "bw": share})
+        print(f"\u2705 Split {bw} Mbps over {len(subflows)} paths (group {group}): "
+              + ", ".join(f"{s['bw']} Mbps on TCP {s['tcp_port']}" for s in subflows))
+        return {"tunnel_id": group, "tcp_port": reserved[0][1], "subflows": subflows}
+
+    def renew(self, tunnel_id, lease=None):
+        """
+        Restarts the lease of a tunnel (and of the rest of its split group) at lease
+        seconds from now; no lease makes it permanent. One journal line and an O(1)
+        timer-wheel insert per tunnel, no flow API call.
+        """
+        expires = round(time.time() + lease, 3) if lease else None
+        with self._lock:
+            if tunnel_id not in self.store.flows or tunnel_id in self._busy:
+                raise ValueError("Tunnel ID not found.")
+            for tid in self.store.group_members(tunnel_id):
+                self.store.record_renew(tid, expires)
+                if expires is None:
+                    self.leases.cancel(tid)
+                else:
+                    self.leases.schedule(tid, expires)
+        return {"tunnel_id": tunnel_id, "expires": expires}
+
+    def expire_leases(self, now=None):
+        """Tears down every tunnel whose lease ran out, EXPIRY_BATCH per bulk API call."""
+        now = time.time() if now is None else now
+        with self._lock:
+            due = [tid for tid in self.leases.advance(now)
+                   if self.store.flows.get(tid, {}).get("expires", now + 1) <= now]
+        expired = 0
+        for i in range(0, len(due), EXPIRY_BATCH):
+            batch = due[i:i + EXPIRY_BATCH]
+            for tid, outcome in zip(batch, self.deallocate_many(batch)):
+                if not isinstance(outcome, Exception):
+                    expired += 1
+                    continue
+                with self._lock:
+                    # Still there (API failure or busy): try again on the next tick
+                    if tid in self.store.flows:
+                        self.leases.schedule(tid, now + self.leases.tick)
+        self.expired += expired
+        return expired
+
+    def tick(self, now=None):
+        """Releases expired leases and opens booked windows; returns (activated, expired)."""
+        now = time.time() if now is None else now
+        # Expire first: a lease that ran out may still hold bandwidth a window needs now
+        expired = self.expire_leases(now)
+        return self.activate_bookings(now), expired
+
+    # ── advance reservations ─────
+
+    def book(self, src, dst, bw, start, end, k=DEFAULT_K, bw_rev=None, max_delay=None):
+        """
+        Books bw from src to dst (bw_rev, default bw, back) for the window [start, end)
+        (Unix times), within max_delay ms if given. A path qualifies if every arc has its
+        share left over the window after the current residuals and the peak of the other
+        bookings; the tunnel is installed when the window opens and released through its
+        lease when it closes.
+        """
+        now = time.time()
+        self._check_bw(bw, bw_rev)
+        bw_rev = bw if bw_rev is None else bw_rev
+        if src not in self.G or dst not in self.G:
+            raise ValueError("Invalid nodes.")
+        if end <= start or end <= now:
+            raise ValueError("Booking window must end after it starts and in the future.")
+        with self._lock:
+            if now - self.calendar.epoch > self.calendar.horizon / 2:
+                self._load_bookings(now)  # slide the calendar forward
+            window_start = max(start, now)
+            W = self.G.copy()
+            for u, v, data in W.edges(data=True):
+                # Booked windows already open are in the residuals: count them once
+                data['weight'] += self.active_booked.get((u, v), 0) - self.calendar.peak(u, v, window_start, end)
+            if max_delay is not None:
+                path, _ = delay_constrained_path(W, src, dst, bw, max_delay, bw_rev)
+                if path is None:
+                    raise ValueError(f"No path within {max_delay} ms has {bw} Mbps free over the whole window.")
+                min_seg = path_headroom(W, path, bw, bw_rev)
+            else:
+                paths, _ = find_candidate_paths(W, src, dst, k, bw, 'cspf', bw_rev)
+                if not paths:
+                    raise ValueError(f"No path has {bw} Mbps free over the whole window.")
+                path, min_seg = least_segmentation(W, paths, bw, bw_rev)
+
+            booking_id = self.next_booking
+            self.next_booking += 1
+            booking = {"src": src, "dst": dst, "path": path, "bw": bw, "start": start, "end": end}
+            if bw_rev != bw:
+                booking["bw_rev"] = bw_rev
+            if max_delay is not None:
+                booking["max_delay"] = max_delay
+            self.calendar.add(path, bw, window_start, end, bw_rev)
+            self.store.record_book(booking_id, booking)
+            self.activations.schedule(booking_id, start)
+        print(f"\U0001f4c5 Booked {bw} Mbps on {' → '.join(path)} from {format_time(start)} to "
+              f"{format_time(end)} (booking {booking_id})")
+        return {"booking_id": booking_id, "path": path, "start": start, "end": end, "min_seg": min_seg}
+
+    def cancel_booking(self, booking_id):
+        """Cancels a booking; if its window is already open the tunnel is torn down."""
+        with self._lock:
+            booking = self.store.bookings.get(booking_id)
+            if booking is None:
+                raise ValueError("Booking ID not found.")
+            tunnel_id = booking.get("tunnel_id")
+            if tunnel_id is None:
+                self._drop_booking(booking_id)
+        if tunnel_id is not None:
+            self.deallocate(tunnel_id)
+        return {"booking_id": booking_id, "tunnel_id": tunnel_id}
+
+    def _drop_booking(self, booking_id):
+        """Forgets a booking and frees what is left of its window in the calendar."""
+        with self._lock:
+            booking = self.store.bookings[booking_id]
+            now = time.time()
+            if booking["end"] > now:
+                self.calendar.add(booking["path"], -booking["bw"], max(booking["start"], now), booking["end"],
+                                  -reverse_bw(booking))
+            if booking.get("tunnel_id") is not None:
+                self._count_active(booking, -1)
+            self.activations.cancel(booking_id)
+            self.store.record_unbook(booking_id)
+
+    def activate_bookings(self, now=None):
+        """
+        Installs the tunnels of booked windows that opened, with one bulk API call. A
+        booking that cannot be installed yet is retried on the next tick until its window closes.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            due = [bid for bid in self.activations.advance(now) if bid in self.store.bookings]
+        pending = []
+        for booking_id in due:
+            booking = self.store.bookings[booking_id]
+            if booking["end"] <= now:
+                print(f"\u26a0\ufe0f Booking {booking_id} closed before it could be activated")
+                self._drop_booking(booking_id)
+                continue
+            path, bw, bw_rev = booking["path"], booking["bw"], reverse_bw(booking)
+            try:
+                tunnel_id, tcp_port = self._reserve(path, bw, bw_rev)
+            except ValueError:
+                # The booked path lost capacity (e.g. a link was re-shaped): any path that fits
+                # without eating into the other bookings will do
                 try:
-                    best_path, min_seg = least_segmentation(G, paths, bw)
-                except ValueError as ve:
-                    print(f"\u274c Segmentation check failed: {ve}")
+                    path, _, _, tunnel_id, tcp_port = self._select_and_reserve(
+                        booking["src"], booking["dst"], bw, DEFAULT_K, None, bw_rev, booking.get("max_delay"),
+                        booking["end"], booking)
+                except ValueError as e:
+                    print(f"\u23f3 Booking {booking_id} not activated yet, retrying: {e}")
+                    self._retry_activation(booking_id, now)
                     continue
+            pending.append((booking_id, tunnel_id, tcp_port, path, bw, bw_rev))
 
-                print(f"\u2705 Selected path: {best_path} | Min segmentation: {min_seg}")
+        ops = [FlowApiClient.operation("add", path, port, bw, rate_rev=bw_rev) for _, _, port, path, bw, bw_rev in pending]
+        results = self.api.submit(ops) if self.api else [{"ok": True, "error": None}] * len(ops)
 
-                # Step 3: Prepare for allocation
-                tunnel_id = assign_tunnel_id()
-                tcp_port = BASE_TCP_PORT + tunnel_id
+        activated = 0
+        for (booking_id, tunnel_id, tcp_port, path, bw, bw_rev), res in zip(pending, results):
+            if not res["ok"]:
+                self._rollback(tunnel_id, path, bw, bw_rev)
+                print(f"\u23f3 Booking {booking_id} not activated yet, retrying: Flow API failed: {res['error']}")
+                self._retry_activation(booking_id, now)
+                continue
+            booking = self.store.bookings[booking_id]
+            self._commit(tunnel_id, path, bw, tcp_port, lease=booking["end"] - now, bw_rev=bw_rev,
+                         max_delay=booking.get("max_delay"))
+            with self._lock:
+                if path != booking["path"]:
+                    self.calendar.add(booking["path"], -bw, now, booking["end"], -bw_rev)
+                    self.calendar.add(path, bw, now, booking["end"], bw_rev)
+                self.store.record_activate(booking_id, tunnel_id, path)
+                self._count_active(booking, 1)
+                self._booking_tunnels[tunnel_id] = booking_id
+            activated += 1
+        return activated
 
-                # Step 4: Call Flow API (only commit if success)
-                success = call_flow_api("add", best_path, tcp_port, bw)
-                if not success:
-                    print("\u274c Flow API failed. Aborting allocation.")
+    def _retry_activation(self, booking_id, now):
+        with self._lock:
+            self.activations.schedule(booking_id, now + self.activations.tick)
+
+    # ── teardown ─────────────────
+
+    def deallocate(self, tunnel_id):
+        """Tears down a tunnel; any subflow ID of a split allocation removes the whole group."""
+        with self._lock:
+            flow = self.store.flows.get(tunnel_id)
+            members = self.store.group_members(tunnel_id) if flow else [tunnel_id]
+        if len(members) > 1:
+            outcomes = self._teardown(members)
+            for outcome in outcomes:
+                if isinstance(outcome, Exception):
+                    raise outcome
+            return {"tunnel_id": flow["group"], "subflows": outcomes}
+        flow = self._claim(tunnel_id)
+        if self.api and not self.api.flow("delete", flow["path"], flow["tcp_port"], flow["bw"]):
+            self._unclaim(tunnel_id)
+            print(f"\u274c API failed to delete flow with TCP {flow['tcp_port']}")
+            raise RuntimeError(f"Flow API failed to delete TCP {flow['tcp_port']}; tunnel kept allocated.")
+        return self._release(tunnel_id)
+
+    def reoptimize(self, max_moves=DEFRAG_MAX_MOVES, probe_bw=None, apply=False):
+        """Plans a bounded re-placement of admitted tunnels; applies it only if asked to."""
+        G0 = load_graph(INITIAL_PATH)
+        with self._lock:
+            flows = {tid: dict(flow) for tid, flow in self.store.flows.items()
+                     if tid not in self._busy and tid not in self._booking_tunnels}
+        plan = plan_reoptimization(self.G, flows, G0, max_moves, probe_bw)
+        if apply:
+            plan["applied"] = self.apply_reoptimization(plan)
+        return plan
+
+    def apply_reoptimization(self, plan):
+        """
+        Migrates the planned tunnels one at a time (break-before-make: the same TCP port
+        cannot match on two paths at once). Moves whose tunnel changed or whose new path
+        no longer fits are skipped. Returns the number of tunnels moved.
+        """
+        applied = 0
+        for move in plan["moves"]:
+            tid, old, new, bw = move["tunnel_id"], move["from"], move["to"], move["bw"]
+            bw_rev = move.get("bw_rev", bw)
+            try:
+                flow = self._claim(tid)
+            except ValueError:
+                continue
+            try:
+                # The ID may have been released and reused by another tunnel since planning
+                if flow["path"] != old or flow["bw"] != bw or reverse_bw(flow) != bw_rev:
                     continue
+                # One step, so a concurrent request cannot take the old path's bandwidth in between
+                try:
+                    self._apply_bw_many([(old, -bw, -bw_rev), (new, bw, bw_rev)], self._held(flow.get("expires")))
+                except ValueError:
+                    continue
+                port = flow["tcp_port"]
+                if self.api:
+                    results = self.api.submit([FlowApiClient.operation("delete", old, port, bw),
+                                               FlowApiClient.operation("add", new, port, bw, rate_rev=bw_rev)])
+                    if not results[1]["ok"]:
+                        self._apply_bw_many([(new, -bw, -bw_rev), (old, bw, bw_rev)])
+                        if results[0]["ok"]:
+                            self.api.submit([FlowApiClient.operation("add", old, port, bw, rate_rev=bw_rev)])
+                        print(f"\u274c Could not migrate TID {tid}: {results[1]['error']}")
+                        continue
+                with self._lock:
+                    self.preemption.discard(self.store.flows[tid])
+                    self.store.record_move(tid, new)
+                    self.preemption.add(tid, self.store.flows[tid])
+                applied += 1
+                print(f"\u2713 Migrated TID {tid} to {' → '.join(new)}")
+            finally:
+                self._unclaim(tid)
+        return applied
 
-                # Step 5: Commit changes locally
-                update_graph_bandwidth(G, best_path, bw)
-                save_flow(best_path, bw, tunnel_id, tcp_port)
-                print(f"\u2713 Flow saved (Tunnel ID {tunnel_id}, TCP Port {tcp_port})")
+    def allocate_many(self, reqs):
+        """
+        Selects and reserves a path for every request, installs all of them with one
+        bulk API call, then commits or rolls back each one. Returns, in order, a
+        result dict or the exception that rejected the request.
+        """
+        outcomes = [None] * len(reqs)
+        pending = []
+        for i, req in enumerate(reqs):
+            try:
+                self._check_bw(req["bw"], req.get("bw_rev"))
+            except Exception as e:
+                outcomes[i] = e  # invalid demands never reach the split/preemption fallbacks
+                continue
+            try:
+                bw_rev = req["bw"] if req.get("bw_rev") is None else req["bw_rev"]
+                best_path, min_seg, stats, tunnel_id, tcp_port = self._select_and_reserve(
+                    req["src"], req["dst"], req["bw"], req.get("k", DEFAULT_K), req.get("policy"), bw_rev,
+                    req.get("max_delay"), lease_end(req.get("lease")))
+                pending.append((i, tunnel_id, tcp_port, best_path, req["bw"], bw_rev, min_seg, stats))
+            except ValueError as e:
+                try:
+                    outcomes[i] = self._fallback(e, req["src"], req["dst"], req["bw"], req.get("k", DEFAULT_K),
+                                                 req.get("policy"), req.get("split"),
+                                                 req.get("priority", DEFAULT_PRIORITY), req.get("lease"),
+                                                 req.get("bw_rev"), req.get("max_delay"))
+                except Exception as fallback_error:
+                    outcomes[i] = fallback_error
+            except Exception as e:
+                outcomes[i] = e
+
+        ops = [FlowApiClient.operation("add", path, port, bw, rate_rev=bw_rev)
+               for _, _, port, path, bw, bw_rev, _, _ in pending]
+        results = self.api.submit(ops) if self.api else [{"ok": True, "error": None}] * len(ops)
 
+        for (i, tunnel_id, tcp_port, path, bw, bw_rev, min_seg, stats), res in zip(pending, results):
+            if res["ok"]:
+                self._commit(tunnel_id, path, bw, tcp_port, priority=reqs[i].get("priority", DEFAULT_PRIORITY),
+                             lease=reqs[i].get("lease"), bw_rev=bw_rev, max_delay=reqs[i].get("max_delay"))
+                outcomes[i] = {"tunnel_id": tunnel_id, "tcp_port": tcp_port, "path": path,
+                               "min_seg": min_seg, "search": stats}
+            else:
+                self._rollback(tunnel_id, path, bw, bw_rev)
+                outcomes[i] = RuntimeError(f"Flow API failed: {res['error']}")
+        return outcomes
+
+    def deallocate_many(self, tunnel_ids):
+        """
+        Tears down several tunnels with one bulk API call; same return convention as
+        allocate_many. Subflow IDs of split allocations remove their whole group.
+        """
+        outcomes = [None] * len(tunnel_ids)
+        singles = []
+        for i, tid in enumerate(tunnel_ids):
+            with self._lock:
+                grouped = "group" in self.store.flows.get(tid, {})
+            if not grouped:
+                singles.append(i)
+                continue
+            try:
+                outcomes[i] = self.deallocate(tid)
             except Exception as e:
-                print(f"\u274c Allocation failed: {e}")
+                outcomes[i] = e
+        for i, outcome in zip(singles, self._teardown([tunnel_ids[i] for i in singles])):
+            outcomes[i] = outcome
+        return outcomes
 
-        elif choice == '2':
+    def _teardown(self, tunnel_ids):
+        outcomes = [None] * len(tunnel_ids)
+        pending = []
+        for i, tid in enumerate(tunnel_ids):
             try:
-                with open(ALLOCATED_FLOW_CSV) as f:
-                    flows = list(csv.reader(f))
-                if not flows:
-                    print("No flows allocated.")
+                flow = self._claim(tid)
+            except ValueError as e:
+                outcomes[i] = e
+            else:
+                pending.append((i, tid, FlowApiClient.operation("delete", flow["path"], flow["tcp_port"], flow["bw"])))
+
+        ops = [op for _, _, op in pending]
+        results = self.api.submit(ops) if self.api else [{"ok": True, "error": None}] * len(ops)
+
+        for (i, tid, _), res in zip(pending, results):
+            if res["ok"]:
+                outcomes[i] = self._release(tid)
+            else:
+                self._unclaim(tid)
+                outcomes[i] = RuntimeError(f"Flow API failed: {res['error']}; tunnel kept allocated.")
+        return outcomes
+
+# ─────────────────────────────
+# Batch Mode
+# ─────────────────────────────
+
+def parse_request(req):
+    """Validates one JSON request; returns (op, args) or raises ValueError/KeyError."""
+    op = req.get("op", "allocate")
+    if op == "allocate":
+        return op, {"src": req["src"], "dst": req["dst"], "bw": parse_bw(req["bw"]), "bw_rev": parse_bw_rev(req),
+                    "max_delay": parse_max_delay(req),
+                    "k": int(req.get("k", DEFAULT_K)), "policy": req.get("policy"), "split": req.get("split"),
+                    "priority": parse_priority(req.get("priority", DEFAULT_PRIORITY)),
+                    "lease": parse_lease(req.get("lease"))}
+    if op == "renew":
+        return op, {"tunnel_id": int(req["tunnel_id"]), "lease": parse_lease(req.get("lease"))}
+    if op == "book":
+        return op, parse_booking(req)
+    if op == "cancel":
+        return op, int(req["booking_id"])
+    if op == "deallocate":
+        return op, int(req["tunnel_id"])
+    if op == "reoptimize":
+        probe_bw = req.get("probe_bw")
+        return op, {"max_moves": int(req.get("max_moves", DEFRAG_MAX_MOVES)),
+                    "probe_bw": parse_bw(probe_bw) if probe_bw is not None else None,
+                    "apply": bool(req.get("apply", False))}
+    raise ValueError(f"Unknown op '{op}'.")
+
+def parse_mbps(value):
+    """Whole Mbps from a JSON number or numeric string; a fraction or a boolean is rejected, never truncated."""
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"Bandwidth must be a whole number of Mbps, got {value!r}.")
+    return int(value)
+
+def parse_bw(value):
+    bw = parse_mbps(value)
+    if bw <= 0:
+        raise ValueError("Bandwidth must be a positive number of Mbps.")
+    return bw
+
+def parse_bw_rev(req):
+    """Optional return-direction bandwidth; absent means the same as "bw"."""
+    value = req.get("bw_rev")
+    if value is None:
+        return None
+    bw_rev = parse_mbps(value)
+    if bw_rev < 0:
+        raise ValueError("Reverse bandwidth cannot be negative.")
+    return bw_rev
+
+def parse_max_delay(req):
+    """Optional end-to-end latency bound in ms."""
+    value = req.get("max_delay")
+    if value is None:
+        return None
+    max_delay = float(value)
+    if max_delay <= 0:
+        raise ValueError("Delay bound must be a positive number of milliseconds.")
+    return max_delay
+
+def parse_priority(value):
+    priority = int(value)
+    if not DEFAULT_PRIORITY <= priority <= MAX_PRIORITY:
+        raise ValueError(f"Priority must be between {DEFAULT_PRIORITY} and {MAX_PRIORITY}.")
+    return priority
+
+def parse_lease(value):
+    if value is None:
+        return None
+    lease = float(value)
+    if lease <= 0:
+        raise ValueError("Lease must be a positive number of seconds.")
+    return lease
+
+def parse_booking(req):
+    """Window from absolute "start"/"end" (Unix time) or relative "start_in"/"duration" (seconds)."""
+    start = float(req["start"]) if "start" in req else time.time() + float(req.get("start_in", 0))
+    end = float(req["end"]) if "end" in req else start + float(req["duration"])
+    return {"src": req["src"], "dst": req["dst"], "bw": parse_bw(req["bw"]), "bw_rev": parse_bw_rev(req),
+            "max_delay": parse_max_delay(req), "start": start, "end": end, "k": int(req.get("k", DEFAULT_K))}
+
+def dispatch(allocator, op, args):
+    if op == "allocate":
+        return allocator.allocate(**args)
+    if op == "deallocate":
+        return allocator.deallocate(args)
+    if op == "renew":
+        return allocator.renew(**args)
+    if op == "book":
+        return allocator.book(**args)
+    if op == "cancel":
+        return allocator.cancel_booking(args)
+    return allocator.reoptimize(**args)
+
+def make_result(req, outcome, elapsed):
+    """Turns an allocator return value or exception into a JSON result."""
+    result = {"id": req.get("id"), "op": req.get("op", "allocate")}
+    if isinstance(outcome, (ValueError, KeyError)):
+        result.update(status="rejected", error=str(outcome))
+    elif isinstance(outcome, Exception):
+        result.update(status="error", error=str(outcome))
+    else:
+        result.update(outcome)
+        result["status"] = "ok"
+    result["elapsed_ms"] = round(elapsed * 1000, 3)
+    return result
+
+def handle_request(allocator, req):
+    """Runs one JSON request through the allocator and returns its JSON result."""
+    start = time.perf_counter()
+    try:
+        op, args = parse_request(req)
+        outcome = dispatch(allocator, op, args)
+    except Exception as e:
+        outcome = e
+    return make_result(req, outcome, time.perf_counter() - start)
+
+def handle_group(allocator, op, group):
+    """Runs consecutive requests of the same op with a single bulk flow API call."""
+    start = time.perf_counter()
+    reqs, args = zip(*group)
+    if op == "allocate":
+        outcomes = allocator.allocate_many(list(args))
+    else:
+        outcomes = allocator.deallocate_many(list(args))
+    share = (time.perf_counter() - start) / len(group)
+    return [make_result(req, outcome, share) for req, outcome in zip(reqs, outcomes)]
+
+def read_requests(infile):
+    """Yields (request, error_result) pairs from a JSONL stream, skipping blank lines."""
+    for lineno, line in enumerate(infile, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line), None
+        except json.JSONDecodeError as e:
+            yield None, {"id": None, "line": lineno, "status": "error", "error": f"Invalid JSON: {e}"}
+
+def run_batch(allocator, infile, outfile, group_size=1):
+    """
+    Streams JSONL requests from infile and writes one JSONL result per request to outfile.
+    With group_size > 1, consecutive allocate (or deallocate) requests are installed with
+    one bulk flow API call per group. Progress messages go to stderr so the result
+    stream stays machine-readable.
+    """
+    counts = {"ok": 0, "rejected": 0, "error": 0}
+    allocations = 0
+    start = time.perf_counter()
+
+    def emit(results):
+        nonlocal allocations
+        for result in results:
+            counts[result["status"]] += 1
+            if result["status"] == "ok" and result["op"] == "allocate":
+                allocations += 1
+            outfile.write(json.dumps(result) + "\n")
+        outfile.flush()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        group, group_op = [], None
+
+        def flush_group():
+            if group:
+                emit(handle_group(allocator, group_op, group))
+                group.clear()
+
+        for req, error in read_requests(infile):
+            # Windows that opened and leases that ran out while reading the stream go first
+            allocator.tick()
+            if error:
+                flush_group()
+                emit([error])
+                continue
+            if group_size <= 1:
+                emit([handle_request(allocator, req)])
+                continue
+            try:
+                op, args = parse_request(req)
+            except Exception as e:
+                flush_group()
+                emit([make_result(req, e, 0.0)])
+                continue
+            if op not in ("allocate", "deallocate"):
+                flush_group()
+                emit([handle_request(allocator, req)])
+                continue
+            if op != group_op:
+                flush_group()
+            group.append((req, args))
+            group_op = op
+            if len(group) >= group_size:
+                flush_group()
+        flush_group()
+
+    elapsed = time.perf_counter() - start
+    rate = allocations / elapsed if elapsed > 0 else 0.0
+    print(f"[BATCH] {sum(counts.values())} requests in {elapsed:.3f}s | ok={counts['ok']} "
+          f"rejected={counts['rejected']} error={counts['error']} | {rate:.1f} allocations/s",
+          file=sys.stderr)
+    print(f"[BATCH] Path cache: {allocator.cache.stats()}", file=sys.stderr)
+    print(f"[BATCH] Bottleneck index: {allocator.bottleneck.rejections} early rejections, "
+          f"{allocator.bottleneck.rebuilds} rebuilds", file=sys.stderr)
+    if allocator.preemptions:
+        print(f"[BATCH] Preempted tunnels: {allocator.preemptions}", file=sys.stderr)
+    if allocator.expired:
+        print(f"[BATCH] Expired leases: {allocator.expired}", file=sys.stderr)
+    if allocator.store.bookings:
+        print(f"[BATCH] Bookings pending or open: {len(allocator.store.bookings)}", file=sys.stderr)
+    return counts
+
+# ─────────────────────────────
+# Allocator Service
+# ─────────────────────────────
+
+async def serve(allocator, socket_path=SERVICE_SOCKET, listen=None, workers=SERVICE_WORKERS):
+    """
+    Long-running allocator service speaking the batch JSONL protocol over a Unix socket
+    (or TCP when listen="host:port"). Every request line is handled concurrently in a
+    worker thread and answered with one result line carrying the same "id"; results
+    may arrive out of order.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="alloc")
+
+    async def handle_client(reader, writer):
+        pending = set()
+
+        async def run(req, error):
+            result = error or await loop.run_in_executor(executor, handle_request, allocator, req)
+            writer.write((json.dumps(result) + "\n").encode())
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for req, error in read_requests([line.decode()]):
+                    task = asyncio.create_task(run(req, error))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+
+    if listen:
+        host, port = listen.rsplit(":", 1)
+        server = await asyncio.start_server(handle_client, host, int(port))
+        where = f"tcp://{listen}"
+    else:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = await asyncio.start_unix_server(handle_client, path=socket_path)
+        where = f"unix://{socket_path}"
+
+    print(f"[SERVICE] Allocator listening on {where} with {workers} workers")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=True)
+        if not listen and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+# ─────────────────────────────
+# Main Loop
+# ─────────────────────────────
+
+def interactive_loop(viz1, viz2, policy=DEFAULT_POLICY):
+    G = load_graph(RUNNING_PATH)
+    allocator = SliceAllocator(G, default_policy=policy)
+    start_scheduler(allocator)
+    try:
+        while True:
+            print("\nOptions:")
+            print("1 - Allocate flow")
+            print("2 - Deallocate flow")
+            print("3 - Re-optimize slices")
+            print("4 - Book a future window")
+            print("5 - Exit")
+            choice = input("Choice: ").strip()
+
+            if choice == '1':
+                src = input("Source node: ").strip()
+                dst = input("Destination node: ").strip()
+                if src not in G or dst not in G:
+                    print("Invalid nodes.")
                     continue
 
-                # Group by tunnel ID
-                tunnel_groups = {}
-                for flow in flows:
-                    tid = int(flow[-2])
-                    tunnel_groups.setdefault(tid, []).append(flow)
-
-                # Show summary per tunnel
-                print("\nAllocated Flows:")
-                for tid, group in tunnel_groups.items():
-                    directions = [f"{' → '.join(f[:-3])} (TCP {f[-1]})" for f in group]
-                    bw = group[0][-3]
-                    print(f"TID {tid} | BW: {bw} | Paths: {' + '.join(directions)}")
-
-                # Ask user for Tunnel ID
-                tunnel_id = int(input("\nEnter Tunnel ID to remove: ").strip())
-                if tunnel_id not in tunnel_groups:
-                    print("Tunnel ID not found.")
+                k = int(input("K (number of paths): ").strip())
+                bw = int(input("Bandwidth to allocate (Mbps): ").strip())
+                bw_rev = int(input(f"Reverse bandwidth {dst} → {src} (Mbps) [{bw}]: ").strip() or bw)
+                policy = input(f"Path policy {'/'.join(PATH_POLICIES)} [{allocator.default_policy}]: ").strip() or allocator.default_policy
+                if policy not in PATH_POLICIES:
+                    print("Invalid policy.")
                     continue
+                priority = int(input(f"Priority {DEFAULT_PRIORITY}-{MAX_PRIORITY} [{DEFAULT_PRIORITY}]: ").strip() or DEFAULT_PRIORITY)
+                lease = float(input("Lease in seconds (blank = no expiry): ").strip() or 0) or None
+                max_delay = float(input("Max delay in ms (blank = no bound): ").strip() or 0) or None
 
-                removed_flows = remove_flow_by_tunnel_id(tunnel_id)
+                try:
+                    allocator.allocate(src, dst, bw, k=k, policy=policy, priority=priority, lease=lease, bw_rev=bw_rev,
+                                       max_delay=max_delay)
+                except ValueError as ve:
+                    print(f"\u274c Allocation rejected: {ve}")
+                    if bw_rev == bw and max_delay is None and input(f"Split across up to {MAX_SUBFLOWS} paths? [y/N]: ").strip().lower() == 'y':
+                        try:
+                            allocator.allocate_split(src, dst, bw, priority=priority, lease=lease)
+                        except ValueError as split_error:
+                            print(f"\u274c Split allocation rejected: {split_error}")
+                        except Exception as e:
+                            print(f"\u274c Split allocation failed: {e}")
+                except Exception as e:
+                    print(f"\u274c Allocation failed: {e}")
 
-                for flow in removed_flows:
-                    path = flow[:-3]
-                    bw = int(flow[-3])
-                    tcp_port = int(flow[-1])
-                    if call_flow_api("delete", path, tcp_port, bw):
-                        update_graph_bandwidth(G, path, -bw)
-                        print(f"\u2713 Deallocated flow with TCP {tcp_port}")
-                    else:
-                        print(f"\u274c API failed to delete flow with TCP {tcp_port}")
+            elif choice == '2':
+                try:
+                    flows = dict(allocator.store.flows)  # the lease reaper may release tunnels meanwhile
+                    if not flows:
+                        print("No flows allocated.")
+                        continue
 
-            except Exception as e:
-                print(f"\u274c Deallocation failed: {e}")
+                    # Show summary per tunnel
+                    print("\nAllocated Flows:")
+                    for tid, flow in flows.items():
+                        group = f" | Group {flow['group']}" if "group" in flow else ""
+                        priority = f" | Priority {flow['priority']}" if "priority" in flow else ""
+                        lease = f" | Expires in {max(0, flow['expires'] - time.time()):.0f}s" if "expires" in flow else ""
+                        delay = f" | Delay ≤ {flow['max_delay']:g} ms" if "max_delay" in flow else ""
+                        bw = f"{flow['bw']}/{flow['bw_rev']}" if "bw_rev" in flow else flow['bw']
+                        print(f"TID {tid} | BW: {bw} | Paths: {' → '.join(flow['path'])} (TCP {flow['tcp_port']}){group}{priority}{lease}{delay}")
 
+                    # Ask user for Tunnel ID
+                    tunnel_id = int(input("\nEnter Tunnel ID to remove: ").strip())
+                    if tunnel_id not in flows:
+                        print("Tunnel ID not found.")
+                        continue
 
-        elif choice == '3':
-            print("Exiting.")
-            subprocess.run(["pkill", "-f", "visualize_initial_topology.py"], check=False)
-            subprocess.run(["pkill", "-f", "visualize_running_topology.py"], check=False)
-            sys.exit(0)
+                    allocator.deallocate(tunnel_id)
 
-        else:
-            print("Invalid option.")
+                except Exception as e:
+                    print(f"\u274c Deallocation failed: {e}")
+
+
+            elif choice == '3':
+                try:
+                    plan = allocator.reoptimize()
+                    print_reoptimization_plan(plan)
+                    if not plan["moves"]:
+                        print("Nothing to migrate.")
+                        continue
+                    if input("Apply this plan? [y/N]: ").strip().lower() == 'y':
+                        moved = allocator.apply_reoptimization(plan)
+                        print(f"\u2713 Migrated {moved}/{len(plan['moves'])} tunnels")
+                except Exception as e:
+                    print(f"\u274c Re-optimization failed: {e}")
+
+            elif choice == '4':
+                try:
+                    bookings = dict(allocator.store.bookings)
+                    for bid, b in sorted(bookings.items()):
+                        state = f"open (TID {b['tunnel_id']})" if b.get("tunnel_id") is not None else "pending"
+                        bw = f"{b['bw']}/{b['bw_rev']}" if "bw_rev" in b else b['bw']
+                        print(f"Booking {bid} | {b['src']} → {b['dst']} | BW: {bw} | "
+                              f"{format_time(b['start'])} – {format_time(b['end'])} | {state}")
+                    action = input("b - book a window, c - cancel a booking [b]: ").strip() or 'b'
+                    if action == 'c':
+                        allocator.cancel_booking(int(input("Booking ID to cancel: ").strip()))
+                        continue
+                    src = input("Source node: ").strip()
+                    dst = input("Destination node: ").strip()
+                    bw = int(input("Bandwidth to book (Mbps): ").strip())
+                    bw_rev = int(input(f"Reverse bandwidth {dst} → {src} (Mbps) [{bw}]: ").strip() or bw)
+                    max_delay = float(input("Max delay in ms (blank = no bound): ").strip() or 0) or None
+                    start = time.time() + 60 * float(input("Start in how many minutes: ").strip())
+                    end = start + 60 * float(input("Duration in minutes: ").strip())
+                    allocator.book(src, dst, bw, start, end, bw_rev=bw_rev, max_delay=max_delay)
+                except ValueError as ve:
+                    print(f"\u274c Booking rejected: {ve}")
+                except Exception as e:
+                    print(f"\u274c Booking failed: {e}")
+
+            elif choice == '5':
+                print("Exiting.")
+                subprocess.run(["pkill", "-f", "visualize_initial_topology.py"], check=False)
+                subprocess.run(["pkill", "-f", "visualize_running_topology.py"], check=False)
+                sys.exit(0)
+
+            else:
+                print("Invalid option.")
+    finally:
+        # Flush the residual graph even when exiting via sys.exit / signals
+        allocator.close()
 
 # ─────────────────────────────
 # Entry Point
 # ─────────────────────────────
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SDN slice allocator (interactive menu or JSONL batch mode).")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="process JSONL allocate/deallocate requests from FILE ('-' for stdin) and exit")
+    parser.add_argument("--out", metavar="FILE", default="-",
+                        help="where batch results are written as JSONL (default: stdout)")
+    parser.add_argument("--serve", action="store_true",
+                        help="run as a long-lived concurrent allocator service instead of the menu")
+    parser.add_argument("--socket", metavar="PATH", default=SERVICE_SOCKET,
+                        help=f"Unix socket for --serve (default: {SERVICE_SOCKET})")
+    parser.add_argument("--listen", metavar="HOST:PORT",
+                        help="serve over TCP instead of the Unix socket")
+    parser.add_argument("--workers", metavar="N", type=int, default=SERVICE_WORKERS,
+                        help=f"concurrent requests handled by --serve (default: {SERVICE_WORKERS})")
+    parser.add_argument("--defrag-interval", metavar="SECONDS", type=float,
+                        help="with --serve, re-optimize admitted slices in the background every SECONDS")
+    parser.add_argument("--no-api", action="store_true",
+                        help="skip the /flow API calls and only update local state")
+    parser.add_argument("--policy", choices=PATH_POLICIES, default=DEFAULT_POLICY,
+                        help=f"default routing policy for this run; requests may override it (default: {DEFAULT_POLICY})")
+    parser.add_argument("--path-cache", metavar="N", type=int, default=PATH_CACHE_SIZE,
+                        help=f"candidate path cache entries, 0 disables caching (default: {PATH_CACHE_SIZE})")
+    parser.add_argument("--split", action="store_true",
+                        help=f"spread demands no single path can carry over up to {MAX_SUBFLOWS} paths "
+                             "(requests may set \"split\" to override)")
+    parser.add_argument("--group", metavar="N", type=int, default=1,
+                        help="install up to N consecutive batch requests with one bulk /flows call")
+    return parser.parse_args()
+
+def main_batch(args):
+    with contextlib.redirect_stdout(sys.stderr):
+        allocator = SliceAllocator(load_graph(RUNNING_PATH), use_api=not args.no_api,
+                                   cache_size=args.path_cache, default_policy=args.policy, split=args.split)
+    infile = sys.stdin if args.batch == '-' else open(args.batch)
+    outfile = sys.stdout if args.out == '-' else open(args.out, 'w')
+    try:
+        run_batch(allocator, infile, outfile, group_size=args.group)
+    finally:
+        allocator.close()
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+def main_serve(args):
+    allocator = SliceAllocator(load_graph(RUNNING_PATH), use_api=not args.no_api,
+                               cache_size=args.path_cache, default_policy=args.policy,
+                               api_pool_size=args.workers, split=args.split)
+    start_scheduler(allocator)
+    if args.defrag_interval:
+        start_reoptimizer(allocator, args.defrag_interval)
+    try:
+        asyncio.run(serve(allocator, args.socket, args.listen, args.workers))
+    except KeyboardInterrupt:
+        print("\n[SERVICE] Shutting down.")
+    finally:
+        allocator.close()
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.batch:
+        main_batch(args)
+        sys.exit(0)
+    if args.serve:
+        def stop_service(*_):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop_service)
+        main_serve(args)
+        sys.exit(0)
+
     viz1 = subprocess.Popen(["gnome-terminal", "--", "bash", "-c", "python3 visualize_initial_topology.py"])
     viz2 = subprocess.Popen(["gnome-terminal", "--", "bash", "-c", "python3 visualize_running_topology.py"])
 
@@ -234,9 +2926,8 @@ if __name__ == "__main__":
     signal.signal(signal.SIGTERM, cleanup_and_exit)
 
     try:
-        interactive_loop(viz1, viz2)
+        interactive_loop(viz1, viz2, policy=args.policy)
     finally:
         # Use pkill here as well to clean up
         subprocess.run(["pkill", "-f", "visualize_initial_topology.py"], check=False)
         subprocess.run(["pkill", "-f", "visualize_running_topology.py"], check=False)
-
@@ -1,15 +1,17 @@
 #mininet_runner.py
 from flask import Flask, request, jsonify
-from threading import Thread
+from threading import Thread, Event, Lock
 from werkzeug.serving import make_server
 import json, os
 from mininet.topo import Topo
 from mininet.node import OVSSwitch, RemoteController
-from mininet.link import TCLink
+from mininet.link import Link, TCLink, TCIntf
 from mininet.net import Mininet
 from mininet.cli import CLI
 from mininet.log import setLogLevel
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from topology_store import import_csv, snapshot_path, write_snapshot
 
 app = Flask(__name__)
 net = None  # Global Mininet object
@@ -19,26 +21,205 @@ RUNNING_PATH = 'data/running_network.csv'
 TOPOLOGY_CSV = 'data/my_topology.csv'
 
 ALLOC_FILE = "data/allocated_flows.json"
+FLUSH_DELAY = 0.5   # seconds of /flow changes coalesced into one write of ALLOC_FILE
 
-# Ensure JSON file exists
-if not os.path.exists(ALLOC_FILE):
-    with open(ALLOC_FILE, "w") as f:
-        json.dump([], f)
+# Allocator state (main.py) that belongs to a previous network run
+ALLOCATOR_FLOW_CSV = 'data/allocated_flow.csv'
+ALLOCATOR_STATE_FILES = ['data/allocation_journal.jsonl', 'data/allocation_snapshot.json']
 
 # ──────────────────────────────
-# Utility Functions
+# Flow Table
+# ──────────────────────────────
+
+class FlowTable:
+    """
+    Installed flow records kept in memory, indexed by (src_ip, dst_ip, tcp_port) and
+    by tunnel (its TCP port, shared by the forward and reverse record). ALLOC_FILE is
+    the controller's view of the table: changes mark it dirty and a background thread
+    rewrites it at most once per FLUSH_DELAY, atomically (temp file + rename).
+    """
+
+    def __init__(self, path=ALLOC_FILE, delay=FLUSH_DELAY):
+        self.path = path
+        self.delay = delay
+        self.flows = {}     # (src_ip, dst_ip, tcp_port) -> record, in install order
+        self.tunnels = {}   # tcp_port -> keys of its records (dict as an ordered set)
+        self._lock = Lock()
+        self._dirty = False
+        self._wake = Event()
+        self._stop = Event()
+        if os.path.exists(path):
+            with open(path) as f:
+                for flow in json.load(f):
+                    self._add(flow)
+        else:
+            self._dirty = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._wake.set()
+
+    @staticmethod
+    def key(flow):
+        return flow["src_ip"], flow["dst_ip"], flow["tcp_port"]
+
+    def _add(self, flow):
+        key = self.key(flow)
+        self.flows[key] = flow
+        self.tunnels.setdefault(flow["tcp_port"], {})[key] = None
+
+    def _remove(self, key):
+        flow = self.flows.pop(key, None)
+        if flow is not None:
+            keys = self.tunnels[key[2]]
+            keys.pop(key, None)
+            if not keys:
+                del self.tunnels[key[2]]
+        return flow
+
+    def apply(self, changes):
+        """
+        Applies (records to add, keys to remove) pairs in order, all under one lock,
+        so readers and the next write see either none or all of them.
+        """
+        with self._lock:
+            for adds, removes in changes:
+                for key in removes:
+                    self._remove(key)
+                for flow in adds:
+                    self._remove(self.key(flow))  # a re-add moves the record to the end
+                    self._add(flow)
+            if changes:
+                self._mark_dirty()
+
+    def clear(self):
+        """Drops every record and rewrites ALLOC_FILE right away, empty."""
+        with self._lock:
+            self.flows.clear()
+            self.tunnels.clear()
+        self.flush()
+
+    def tunnel(self, tcp_port):
+        with self._lock:
+            return [self.flows[key] for key in self.tunnels.get(tcp_port, ())]
+
+    def __len__(self):
+        return len(self.flows)
+
+    def _mark_dirty(self):
+        self._dirty = True
+        self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            self._dirty = False
+            flows = list(self.flows.values())
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(flows, f)
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        if self._dirty:
+            self.flush()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            if self._stop.wait(self.delay):
+                return
+            self._wake.clear()
+            try:
+                if self._dirty:
+                    self.flush()
+            except Exception as e:
+                print(f"\033[91m[ERROR]\033[0m Failed to write {self.path}: {e}")
+
+flow_table = FlowTable()
+
 # ──────────────────────────────
+# Node Executors
+# ──────────────────────────────
+
+class NodeExecutors:
+    """
+    One single-thread executor per Mininet node. A node's shell is not safe to drive
+    from several threads, so commands for the same node queue up in order, while
+    different nodes run in parallel and the HTTP threads stay free for /flow.
+    """
 
-def load_allocated_flows():
-    with open(ALLOC_FILE, "r") as f:
-        return json.load(f)
+    def __init__(self):
+        self._executors = {}
+        self._lock = Lock()
 
-def save_allocated_flows(flows):
-    with open(ALLOC_FILE, "w") as f:
-        json.dump(flows, f, indent=2)
+    def submit(self, node, fn, *args, **kwargs):
+        with self._lock:
+            executor = self._executors.get(node)
+            if executor is None:
+                executor = self._executors[node] = ThreadPoolExecutor(max_workers=1,
+                                                                      thread_name_prefix=f"node-{node}")
+        return executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        with self._lock:
+            executors, self._executors = list(self._executors.values()), {}
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+node_executors = NodeExecutors()
+
+# ──────────────────────────────
+# Port Map
+# ──────────────────────────────
+
+port_map = {}   # (node_a, node_b) -> (port on node_a, port on node_b, link)
+hosts = {}      # host name -> {"ip", "mac", "switch"}
+
+def build_port_map(net):
+    """
+    Indexes every link by its ordered node pair and caches the host records, once
+    after net.start(), so resolving a path's ports is dict lookups instead of
+    net.linksBetween() scans of the whole link list per hop.
+    """
+    port_map.clear()
+    hosts.clear()
+    attached = {}
+    for link in net.links:
+        a, b = link.intf1.node, link.intf2.node
+        port_a, port_b = a.ports[link.intf1], b.ports[link.intf2]
+        # setdefault keeps the first of parallel links, as linksBetween(...)[0] did
+        port_map.setdefault((a.name, b.name), (port_a, port_b, link))
+        port_map.setdefault((b.name, a.name), (port_b, port_a, link))
+        attached.setdefault(a.name, b.name)
+        attached.setdefault(b.name, a.name)
+    for host in net.hosts:
+        hosts[host.name] = {"ip": host.IP(), "mac": host.MAC(), "switch": attached.get(host.name)}
+    print(f"\033[92m[INFO]\033[0m Port map built: {len(port_map) // 2} links, {len(hosts)} hosts")
+
+def host_record(name):
+    if name not in hosts:
+        raise ValueError(f"Unknown host {name}")
+    return hosts[name]
+
+def resolve_ports(path):
+    """out_ports, in_ports and links of a host-to-host path, hop by hop from the port map."""
+    out_ports, in_ports, links = {}, {}, []
+    for a, b in zip(path, path[1:]):
+        if (a, b) not in port_map:
+            raise ValueError(f"No link between {a} and {b}")
+        out_ports[a], in_ports[b], _ = port_map[(a, b)]
+        links.append([a, b])
+    return out_ports, in_ports, links
+
+# ──────────────────────────────
+# Utility Functions
+# ──────────────────────────────
 
 def snapshot_initial_topology(source_csv):
     shutil.copyfile(source_csv, INITIAL_PATH)
+    import_csv(INITIAL_PATH)
     print(f"\033[94m[SNAPSHOT]\033[0m Initial topology overwritten at: {INITIAL_PATH}")
 
 
@@ -46,151 +227,234 @@ def snapshot_initial_topology(source_csv):
 # API: Add or Remove Flows
 # ──────────────────────────────
 
-@app.route('/flow', methods=['POST'])
-def handle_flow():
-    data = request.json
+def is_number(value, types=(int, float)):
+    # bool is an int subclass, but true/false is never a port or a rate
+    return isinstance(value, types) and not isinstance(value, bool)
+
+def plan_flow(data):
+    """
+    Validates one flow operation and resolves it against the port map into
+    (records to add, keys to remove). Raises ValueError if it cannot be applied,
+    malformed field types included.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Operation must be an object")
     command = data.get("command")
     path = data.get("path")
     tcp_port = data.get("tcp_port")
     rate = data.get("rate")
+    rate_rev = data.get("rate_rev", rate)  # reverse-direction rate of an asymmetric slice
     bidirectional = data.get("bidirectional", True)
 
     if not (command and path and tcp_port is not None and rate is not None):
-        return jsonify({"error": "Missing required fields"}), 400
+        raise ValueError("Missing required fields")
+
+    if not (isinstance(path, list) and all(isinstance(node, str) for node in path)):
+        raise ValueError("Path must be a list of node names")
+    if not is_number(tcp_port, int):
+        raise ValueError("tcp_port must be an integer")
+    if not (is_number(rate) and is_number(rate_rev)):
+        raise ValueError("rate and rate_rev must be numbers")
 
     if len(path) < 3 or not (path[0].startswith('h') and path[-1].startswith('h')):
-        return jsonify({"error": "Path must start and end with hosts"}), 400
+        raise ValueError("Path must start and end with hosts")
+
+    if command not in ("add", "delete"):
+        raise ValueError("Invalid command")
+
+    src, dst = host_record(path[0]), host_record(path[-1])
+    src_ip, dst_ip = src["ip"], dst["ip"]
+
+    if command == "delete":
+        keys = [(src_ip, dst_ip, tcp_port)]
+        if bidirectional:
+            keys.append((dst_ip, src_ip, tcp_port))
+        return [], keys
+
+    src_mac, dst_mac = src["mac"], dst["mac"]
+    out_ports, in_ports, links = resolve_ports(path)
+
+    # Build forward flow
+    forward_flow = {
+        "src_ip": src_ip,
+        "dst_ip": dst_ip,
+        "src_mac": src_mac,
+        "dst_mac": dst_mac,
+        "tcp_port": tcp_port,
+        "rate": rate,
+        "path": path[1:-1],
+        "out_ports": out_ports,
+        "in_ports": in_ports,
+        "links": links
+    }
+
+    # Build reverse flow
+    reverse_path = path[::-1]
+    reverse_out_ports = {k: v for k, v in in_ports.items()}
+    reverse_in_ports = {k: v for k, v in out_ports.items()}
+    reverse_links = [link[::-1] for link in reversed(links)]
+
+    reverse_flow = {
+        "src_ip": dst_ip,
+        "dst_ip": src_ip,
+        "src_mac": dst_mac,
+        "dst_mac": src_mac,
+        "tcp_port": tcp_port,
+        "rate": rate_rev,
+        "path": reverse_path[1:-1],
+        "out_ports": reverse_out_ports,
+        "in_ports": reverse_in_ports,
+        "links": reverse_links
+    }
+
+    return ([forward_flow, reverse_flow] if bidirectional else [forward_flow]), []
 
+@app.route('/flow', methods=['POST'])
+def handle_flow():
     try:
-        flows = load_allocated_flows()
-
-        src_host, dst_host = path[0], path[-1]
-        src_node = net.get(src_host)
-        dst_node = net.get(dst_host)
-
-        src_ip = src_node.IP()
-        dst_ip = dst_node.IP()
-        src_mac = src_node.MAC()
-        dst_mac = dst_node.MAC()
+        change = plan_flow(request.json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        flow_table.apply([change])
+        return jsonify({"status": "ok", "flows": len(flow_table)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        out_ports = {}
-        in_ports = {}
-        links = []
+@app.route('/flows', methods=['POST'])
+def handle_flows():
+    """
+    Bulk add/delete: {"operations": [<same body as /flow>, ...]}. All operations are
+    validated and resolved first; if any fails, none is applied. Otherwise they are
+    applied in order as one table update, i.e. one file write for the controller.
+    Returns one {"index", "status", "error"} result per operation.
+    """
+    operations = (request.json or {}).get("operations")
+    if not isinstance(operations, list):
+        return jsonify({"error": "Body must be {\"operations\": [...]}"}), 400
+
+    changes, errors = [], {}
+    for i, op in enumerate(operations):
+        try:
+            changes.append(plan_flow(op))
+        except ValueError as e:
+            errors[i] = str(e)
+
+    if errors:
+        first = min(errors)
+        results = [{"index": i, "status": "error", "error": errors[i]} if i in errors else
+                   {"index": i, "status": "aborted", "error": f"Batch rejected: operation {first} failed"}
+                   for i in range(len(operations))]
+        return jsonify({"results": results, "flows": len(flow_table)}), 400
 
-        # Host → First switch
-        first_switch = path[1]
-        link = net.linksBetween(src_node, net.get(first_switch))[0]
-        if link.intf1.node == src_node:
-            out_ports[src_host] = src_node.ports[link.intf1]
-            in_ports[first_switch] = net.get(first_switch).ports[link.intf2]
-        else:
-            out_ports[src_host] = src_node.ports[link.intf2]
-            in_ports[first_switch] = net.get(first_switch).ports[link.intf1]
-        links.append([src_host, first_switch])
-
-        # Switch-to-switch segments
-        for i in range(1, len(path) - 2):
-            a = path[i]
-            b = path[i + 1]
-            link = net.linksBetween(net.get(a), net.get(b))[0]
-            if link.intf1.node.name == a:
-                out_ports[a] = net.get(a).ports[link.intf1]
-                in_ports[b] = net.get(b).ports[link.intf2]
-            else:
-                out_ports[a] = net.get(a).ports[link.intf2]
-                in_ports[b] = net.get(b).ports[link.intf1]
-            links.append([a, b])
-
-        # Last switch → Host
-        last_switch = path[-2]
-        link = net.linksBetween(net.get(last_switch), dst_node)[0]
-        if link.intf1.node == dst_node:
-            out_ports[last_switch] = net.get(last_switch).ports[link.intf2]
-            in_ports[dst_host] = dst_node.ports[link.intf1]
-        else:
-            out_ports[last_switch] = net.get(last_switch).ports[link.intf1]
-            in_ports[dst_host] = dst_node.ports[link.intf2]
-        links.append([last_switch, dst_host])
-
-        # Build forward flow
-        forward_flow = {
-            "src_ip": src_ip,
-            "dst_ip": dst_ip,
-            "src_mac": src_mac,
-            "dst_mac": dst_mac,
-            "tcp_port": tcp_port,
-            "rate": rate,
-            "path": path[1:-1],
-            "out_ports": out_ports,
-            "in_ports": in_ports,
-            "links": links
-        }
-
-        # Build reverse flow
-        reverse_path = path[::-1]
-        reverse_out_ports = {k: v for k, v in in_ports.items()}
-        reverse_in_ports = {k: v for k, v in out_ports.items()}
-        reverse_links = [link[::-1] for link in reversed(links)]
-
-        reverse_flow = {
-            "src_ip": dst_ip,
-            "dst_ip": src_ip,
-            "src_mac": dst_mac,
-            "dst_mac": src_mac,
-            "tcp_port": tcp_port,
-            "rate": rate,
-            "path": reverse_path[1:-1],
-            "out_ports": reverse_out_ports,
-            "in_ports": reverse_in_ports,
-            "links": reverse_links
-        }
-
-        # Apply command
-        if command == "add":
-            flows.append(forward_flow)
-            if bidirectional:
-                flows.append(reverse_flow)
-
-        elif command == "delete":
-            flows = [f for f in flows if not (
-                (f['src_ip'], f['dst_ip'], f['tcp_port']) == (src_ip, dst_ip, tcp_port) or
-                (bidirectional and (f['src_ip'], f['dst_ip'], f['tcp_port']) == (dst_ip, src_ip, tcp_port))
-            )]
-        else:
-            return jsonify({"error": "Invalid command"}), 400
+    try:
+        flow_table.apply(changes)
+    except Exception as e:
+        return jsonify({"results": [{"index": i, "status": "error", "error": str(e)}
+                                    for i in range(len(operations))]}), 500
+    return jsonify({"results": [{"index": i, "status": "ok", "error": None} for i in range(len(operations))],
+                    "flows": len(flow_table)})
 
-        save_allocated_flows(flows)
-        return jsonify({"status": "ok", "flows": len(flows)})
+@app.route('/flow', methods=['GET'])
+def get_tunnel_flows():
+    # Records of one tunnel (forward and reverse), looked up by its TCP port
+    tcp_port = request.args.get("tcp_port", type=int)
+    if tcp_port is None:
+        return jsonify({"error": "Missing tcp_port"}), 400
+    return jsonify({"flows": flow_table.tunnel(tcp_port)})
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+@app.route('/hosts', methods=['GET'])
+def get_hosts():
+    # Host records (IP, MAC, attached switch) cached at startup
+    return jsonify(hosts)
 
 
 # ──────────────────────────────
 # Exec & Bandwidth Endpoints
 # ──────────────────────────────
 
+def split_exec_cmd(cmd):
+    """("h1", "arp -s ...") from "h1 arp -s ...", or None without both parts."""
+    tokens = cmd.strip().split()
+    if len(tokens) < 2:
+        return None
+    return tokens[0], " ".join(tokens[1:])
+
 @app.route('/exec', methods=['POST'])
 def exec_cmd():
     data = request.json
-    cmd = data.get("cmd", "")
-    tokens = cmd.strip().split()
-    if len(tokens) < 2:
+    parsed = split_exec_cmd(data.get("cmd", ""))
+    if parsed is None:
         return jsonify({"error": "Command must include host and action"}), 400
-    host, host_cmd = tokens[0], " ".join(tokens[1:])
+    host, host_cmd = parsed
     try:
-        result = net.get(host).cmd(host_cmd)
+        # Blocks only this request's thread; other hosts and /flow keep being served
+        result = node_executors.submit(host, net.get(host).cmd, host_cmd).result()
         return jsonify({"result": result})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/exec_batch', methods=['POST'])
+def exec_batch():
+    """
+    Many node commands in one round trip: {"commands": [{"id", "host", "cmd"}, ...]},
+    where "cmd" may also be "<node> <command>" as for /exec and "id" defaults to the
+    item's index. As for /exec, "host" may be any node, switches included. Commands
+    fan out over the per-node queues, so different nodes run concurrently and each
+    node runs its commands in the order given.
+    Returns {"results": {id: {"result": output} or {"error": message}}}.
+    """
+    commands = (request.json or {}).get("commands")
+    if not isinstance(commands, list):
+        return jsonify({"error": "Body must be {\"commands\": [...]}"}), 400
+
+    planned, seen = [], set()
+    for i, item in enumerate(commands):
+        if not isinstance(item, dict):
+            return jsonify({"error": f"Command {i} must be an object"}), 400
+        cid = str(item.get("id", i))  # JSON object keys are strings
+        if cid in seen:
+            return jsonify({"error": f"Duplicate command id {cid}"}), 400
+        seen.add(cid)
+        host, host_cmd = item.get("host"), item.get("cmd", "")
+        if not (isinstance(host_cmd, str) and (host is None or isinstance(host, str))):
+            planned.append((cid, None, "Host and command must be strings"))
+            continue
+        if not host:
+            host, host_cmd = split_exec_cmd(host_cmd) or (None, None)
+        if not (host and host_cmd and host_cmd.strip()):
+            planned.append((cid, None, "Command must include host and action"))
+        elif host not in net:
+            planned.append((cid, None, f"Unknown node {host}"))
+        else:
+            planned.append((cid, host, host_cmd))
+
+    # Submit only once the whole batch is accepted; queues keep each host's order
+    pending = [(cid, node_executors.submit(host, net.get(host).cmd, arg) if host else arg)
+               for cid, host, arg in planned]
+    results = {}
+    for cid, future in pending:
+        if isinstance(future, str):
+            results[cid] = {"error": future}
+            continue
+        try:
+            results[cid] = {"result": future.result()}
+        except Exception as e:
+            results[cid] = {"error": str(e)}
+    return jsonify({"results": results})
+
 @app.route('/set_bw', methods=['POST'])
 def set_bw():
     data = request.json
     node1, node2, bw = data['node1'], data['node2'], data['bw']
-    link = net.linksBetween(net.get(node1), net.get(node2))[0]
-    link.intf1.config(bw=bw)
-    link.intf2.config(bw=bw)
+    if (node1, node2) not in port_map:
+        return jsonify({"error": f"No link between {node1} and {node2}"}), 400
+    link = port_map[(node1, node2)][2]
+    # TC shapes egress traffic, so node1's interface limits the node1 -> node2 direction only
+    intf = link.intf1 if link.intf1.node.name == node1 else link.intf2
+    # Re-shaping rebuilds the qdisc chain, so carry the link's configured delay over.
+    # tc runs in the interface's node shell, so it queues behind that node's commands.
+    node_executors.submit(intf.node.name, intf.config, bw=bw, delay=intf.params.get('delay')).result()
     return jsonify({"status": "ok"})
 
 # ──────────────────────────────
@@ -200,7 +464,8 @@ def set_bw():
 class FlaskThread(Thread):
     def __init__(self, app):
         super().__init__()
-        self.server = make_server('0.0.0.0', 5000, app)
+        # One thread per request: a slow /exec must not hold up /flow or /set_bw
+        self.server = make_server('0.0.0.0', 5000, app, threaded=True)
         self.ctx = app.app_context()
         self.ctx.push()
 
@@ -253,6 +518,17 @@ def run():
     # Ensure the runtime CSV exists and is empty
     os.makedirs("data", exist_ok=True)
     open(RUNNING_PATH, 'w').close()
+    if os.path.exists(snapshot_path(RUNNING_PATH)):
+        os.remove(snapshot_path(RUNNING_PATH))
+
+    # Flows allocated on a previous network are not installed on this one: reset the
+    # allocator's state and the controller's flow table together, so tunnel IDs and
+    # TCP ports handed out again never meet last run's records
+    flow_table.clear()
+    open(ALLOCATOR_FLOW_CSV, 'w').close()
+    for state_file in ALLOCATOR_STATE_FILES:
+        if os.path.exists(state_file):
+            os.remove(state_file)
 
     print("\n\033[96m[TOPO SETUP]\033[0m Choose a topology source:")
     print("  1 - Load from CSV file (data/my_topology.csv)")
@@ -271,17 +547,19 @@ def run():
         class CSVTopo(Topo):
             def build(self):
                 nodes = {}
-                link_count = 0
-                with open(RUNNING_PATH) as f:
-                    reader = csv.reader(f)
-                    for row in reader:
-                        n1, n2, bw = row[0].strip(), row[1].strip(), float(row[2])
-                        for n in (n1, n2):
-                            if n not in nodes:
-                                nodes[n] = self.addHost(n) if n.startswith('h') else self.addSwitch(n)
-                        self.addLink(nodes[n1], nodes[n2], cls=TCLink, bw=bw)
-                        link_count += 1
-                print(f"\033[92m[INFO]\033[0m Created {len(nodes)} nodes and {link_count} links from CSV.")
+                # Imports the CSV into the binary snapshot the allocator and visualizers load.
+                # Links are (n1, n2, bw_12, bw_21, delay_ms); delay 0 means none configured.
+                links = import_csv(RUNNING_PATH)
+                for n1, n2, bw, bw_rev, delay in links:
+                    for n in (n1, n2):
+                        if n not in nodes:
+                            nodes[n] = self.addHost(n) if n.startswith('h') else self.addSwitch(n)
+                    params1, params2 = {'bw': bw}, {'bw': bw_rev}
+                    if delay:
+                        params1['delay'] = params2['delay'] = f"{delay:g}ms"
+                    self.addLink(nodes[n1], nodes[n2], cls=Link, intf=TCIntf,
+                                 params1=params1, params2=params2)
+                print(f"\033[92m[INFO]\033[0m Created {len(nodes)} nodes and {len(links)} links from CSV.")
 
         topo = CSVTopo()
 
@@ -308,6 +586,7 @@ def run():
             writer = csv.writer(f)
             for link in links:
                 writer.writerow(link)
+        write_snapshot(snapshot_path(RUNNING_PATH), [(n1, n2, bw, bw, 0.0) for n1, n2, bw in links])
 
         # Define Mininet Topology
         class DenseRandomTopo(Topo):
@@ -332,13 +611,14 @@ def run():
     controller = RemoteController('c0', ip='127.0.0.1', port=6633)
     net = Mininet(topo=topo, controller=controller, switch=OVSSwitch, link=TCLink, autoSetMacs=True)
     net.start()
+    build_port_map(net)
 
     # ──────────────────────────────
     # Fix file ownership to user (if run with sudo)
     # ──────────────────────────────
     user_uid = os.getenv("SUDO_UID") or "1000"
     try:
-        os.system(f"chown {user_uid}:{user_uid} data/*.csv")
+        os.system(f"chown {user_uid}:{user_uid} data/*.csv data/*.topo")
         os.system(f"chown {user_uid}:{user_uid} {ALLOC_FILE}")
         print(f"\033[92m[INFO]\033[0m File ownership set to UID {user_uid}")
     except Exception as e:
@@ -356,6 +636,8 @@ def run():
         print("\n\033[91m[SHUTDOWN]\033[0m Stopping network...")
         net.stop()
         flask_thread.shutdown()
+        node_executors.shutdown()
+        flow_table.close()
 
 
 
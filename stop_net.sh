@@ -43,6 +43,18 @@ for file in "${CSV_FILES[@]}"; do
     fi
 done
 
+STATE_FILES=("data/allocation_journal.jsonl" "data/allocation_snapshot.json")
+
+echo "[stop_net] 📒 Removing allocator journal and snapshot..."
+for file in "${STATE_FILES[@]}"; do
+    if [ -f "$file" ]; then
+        rm -f "$file"
+        echo "  - Removed: $file"
+    else
+        echo "  - Skipped (not found): $file"
+    fi
+done
+
 JSON_LIST_FILES=("data/allocated_flows.json")
 
 echo "[stop_net] 📘 Resetting JSON list-based state files..."
@@ -0,0 +1,189 @@
+# topology_store.py
+"""
+Binary topology snapshots shared by the allocator, the Mininet runner and the visualizers.
+
+A snapshot holds the node names, a CSR adjacency (arcs grouped by source node) and
+per-arc capacity and delay arrays in one file that is memory-mapped on load, so
+reading a large topology is a few array casts instead of a CSV parse. The CSV stays
+the import/export format: the snapshot lives next to it (running_network.csv ->
+running_network.topo) and is only trusted while it is at least as new as the CSV.
+"""
+import os
+import csv
+import math
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b'TOPO'
+VERSION = 2
+HEADER = struct.Struct('<4sIIII')   # magic, version, nodes, arcs, bytes of node names
+# Arrays are stored in native byte order right after the (8-byte padded) name table:
+# delay and capacity (d) per arc, then offsets (I, nodes + 1), targets, reverse arc index
+DELAY_UNITS = (('us', 0.001), ('ms', 1.0), ('s', 1000.0))   # Mininet delay suffixes, in ms
+
+def parse_delay(col):
+    """Delay in ms from a Mininet delay string such as 5ms, 500us or 0.1s; None if it is not one."""
+    for unit, scale in DELAY_UNITS:
+        if col.endswith(unit):
+            try:
+                return float(col[:-len(unit)]) * scale
+            except ValueError:
+                return None
+    return None
+
+def parse_bw(col):
+    """Bandwidth in Mbps as an int when whole (100, 100.0), else a float (100.5)."""
+    bw = float(col)
+    return int(bw) if bw.is_integer() else bw
+
+def parse_link_row(row):
+    """
+    (a, b, bw_ab, bw_ba, delay_ms) from a,b,bw[,bw_ba][,<delay>], or None if the row
+    is not a link. Bandwidths are numbers of Mbps; the delay column is the one with a
+    unit (us, ms or s), as Mininet writes it.
+    """
+    if len(row) < 3:
+        return None
+    cols = [c.strip() for c in row[2:]]
+    delays = [d for d in map(parse_delay, cols) if d is not None]
+    try:
+        bws = [parse_bw(c) for c in cols if parse_delay(c) is None]
+    except ValueError:
+        return None
+    if len(bws) not in (1, 2) or len(delays) > 1 or min(bws) < 0 or not all(map(math.isfinite, bws)):
+        return None
+    return row[0].strip(), row[1].strip(), bws[0], bws[-1], delays[0] if delays else 0.0
+
+def read_csv_links(path):
+    """Links of the CSV at path; rows that are not links are reported on stderr and skipped."""
+    links = []
+    with open(path, newline='') as f:
+        for line, row in enumerate(csv.reader(f), 1):
+            link = parse_link_row(row)
+            if link:
+                links.append(link)
+            elif any(c.strip() for c in row):
+                print(f"\u26a0\ufe0f {path}:{line}: skipping row that is not a link: {','.join(row)}",
+                      file=sys.stderr)
+    return links
+
+def snapshot_path(csv_path):
+    return os.path.splitext(csv_path)[0] + '.topo'
+
+def write_snapshot(path, links):
+    """Writes (a, b, bw_ab, bw_ba, delay_ms) links as a snapshot, atomically (temp file + rename)."""
+    index, nodes, out = {}, [], []
+    for a, b, bw, bw_rev, delay in links:
+        for n in (a, b):
+            if n not in index:
+                index[n] = len(nodes)
+                nodes.append(n)
+                out.append([])
+        i, j = index[a], index[b]
+        out[i].append((j, bw, delay, len(out[j])))
+        out[j].append((i, bw_rev, delay, len(out[i]) - 1))
+
+    offsets = array('I', [0])
+    for arcs in out:
+        offsets.append(offsets[-1] + len(arcs))
+    targets, reverse, capacity, delays = array('I'), array('I'), array('d'), array('d')
+    for arcs in out:
+        for j, bw, delay, k in arcs:
+            targets.append(j)
+            reverse.append(offsets[j] + k)
+            capacity.append(bw)
+            delays.append(delay)
+
+    names = '\n'.join(nodes).encode()
+    pad = -(HEADER.size + len(names)) % 8
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(nodes), len(targets), len(names)))
+        f.write(names + b'\0' * pad)
+        for arr in (delays, capacity, offsets, targets, reverse):
+            f.write(arr.tobytes())
+    os.replace(tmp_path, path)
+
+class TopologySnapshot:
+    """
+    Read-only view of a snapshot file. nodes is the node ID -> name list; offsets,
+    targets, reverse (index of the opposite arc), capacity and delay are memoryviews
+    over the mapped file, with the arcs of node i at offsets[i]:offsets[i + 1].
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, m, name_len = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} topology snapshot")
+        buf = memoryview(self._map)
+        pos = HEADER.size
+        self.nodes = bytes(buf[pos:pos + name_len]).decode().split('\n') if n else []
+        pos += name_len + (-(pos + name_len) % 8)
+        views = []
+        for fmt, count in (('d', m), ('d', m), ('I', n + 1), ('I', m), ('I', m)):
+            size = array(fmt).itemsize * count
+            views.append(buf[pos:pos + size].cast(fmt))
+            pos += size
+        self.delay, self.capacity, self.offsets, self.targets, self.reverse = views
+
+    def neighbors(self, i):
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def arcs(self):
+        """(u, v, capacity, delay_ms) for every arc, by node name."""
+        nodes, offsets = self.nodes, self.offsets.tolist()
+        sources = [nodes[i] for i in range(len(nodes)) for _ in range(offsets[i + 1] - offsets[i])]
+        return zip(sources, [nodes[j] for j in self.targets.tolist()], self._capacities(), self.delay.tolist())
+
+    def _capacities(self):
+        # Whole capacities come back as ints, as read_csv_links returns them
+        return [int(bw) if bw.is_integer() else bw for bw in self.capacity.tolist()]
+
+    def links(self):
+        """(a, b, bw_ab, bw_ba, delay_ms) once per link."""
+        capacity, reverse = self._capacities(), self.reverse.tolist()
+        return [(u, v, bw, capacity[reverse[e]], delay)
+                for e, (u, v, bw, delay) in enumerate(self.arcs()) if e < reverse[e]]
+
+    def close(self):
+        for view in (self.delay, self.offsets, self.targets, self.reverse, self.capacity):
+            view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def is_fresh(csv_path):
+    """True if the snapshot next to csv_path exists and is not older than the CSV."""
+    snap = snapshot_path(csv_path)
+    if not os.path.exists(snap):
+        return False
+    return not os.path.exists(csv_path) or os.path.getmtime(snap) >= os.path.getmtime(csv_path)
+
+def import_csv(csv_path):
+    """Parses the CSV at csv_path and writes its snapshot; returns the links."""
+    links = read_csv_links(csv_path)
+    write_snapshot(snapshot_path(csv_path), links)
+    return links
+
+def load_links(csv_path):
+    """
+    Links of the topology at csv_path, from its snapshot when fresh, else from the CSV.
+    Readers never write snapshots, so one can not overwrite a newer one with stale links.
+    A snapshot in an older format is ignored the same way.
+    """
+    if is_fresh(csv_path):
+        try:
+            with TopologySnapshot(snapshot_path(csv_path)) as snap:
+                return snap.links()
+        except ValueError:
+            pass
+    return read_csv_links(csv_path)
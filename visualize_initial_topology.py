@@ -1,26 +1,19 @@
 # visualize_initial_topology.py
-import csv
 import math
 import networkx as nx
 import matplotlib.pyplot as plt
+from topology_store import load_links
 from matplotlib import cm
 import os
 
 INITIAL_PATH = 'data/initial_topology.csv'
 
-def load_topology_from_csv(path):
+def load_topology(path):
+    # Served from the binary snapshot next to the CSV while it is current
     G = nx.Graph()
-    with open(path, newline='') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            if len(row) != 3:
-                continue
-            node1, node2, bw = row[0].strip(), row[1].strip(), row[2].strip()
-            try:
-                bw = int(bw)
-            except ValueError:
-                bw = 0
-            G.add_edge(node1, node2, bandwidth=bw)
+    for node1, node2, bw, bw_rev, _ in load_links(path):
+        # An asymmetric link is labelled with both directions, node1 -> node2 first
+        G.add_edge(node1, node2, bandwidth=bw if bw == bw_rev else f"{bw}/{bw_rev}")
     return G
 
 def get_switch_and_host_nodes(G):
@@ -98,7 +91,7 @@ def visualize_initial_topology(path):
         print(f"\033[91m[ERROR]\033[0m Initial topology file not found: {path}")
         return
 
-    G = load_topology_from_csv(path)
+    G = load_topology(path)
     pos = compute_node_positions(G)
     switches, hosts = get_switch_and_host_nodes(G)
     node_colors = ['skyblue' if n in switches else 'lightgreen' for n in G.nodes()]
@@ -1,8 +1,8 @@
 # visualize_running_topology.py
-import csv
 import math
 import networkx as nx
 import matplotlib.pyplot as plt
+from topology_store import load_links
 from matplotlib import cm
 import threading
 import time
@@ -13,19 +13,12 @@ warnings.filterwarnings("ignore", message=".*Matplotlib GUI outside of the main
 
 CSV_PATH = 'data/running_network.csv'
 
-def load_topology_from_csv(path):
+def load_topology(path):
+    # Served from the binary snapshot next to the CSV while it is current
     G = nx.Graph()
-    with open(path, newline='') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            if len(row) != 3:
-                continue
-            node1, node2, bw = row[0].strip(), row[1].strip(), row[2].strip()
-            try:
-                bw = int(bw)
-            except ValueError:
-                bw = 0
-            G.add_edge(node1, node2, bandwidth=bw)
+    for node1, node2, bw, bw_rev, _ in load_links(path):
+        # An asymmetric link is labelled with both directions, node1 -> node2 first
+        G.add_edge(node1, node2, bandwidth=bw if bw == bw_rev else f"{bw}/{bw_rev}")
     return G
 
 def get_switch_and_host_nodes(G):
@@ -122,7 +115,7 @@ def draw_topology(G, pos):
 def live_visualizer(csv_path, refresh_interval=1):
     plt.figure("Live Running Network")
     while True:
-        G = load_topology_from_csv(csv_path)
+        G = load_topology(csv_path)
         pos = compute_node_positions(G)
         draw_topology(G, pos)
         time.sleep(refresh_interval)